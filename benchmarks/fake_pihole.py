@@ -0,0 +1,187 @@
+"""
+A local stand-in for the Pi-hole v6 API, serving canned responses with a configurable latency.
+
+Run it on its own with `python benchmarks/fake_pihole.py --port 8080 --latency 0.05`
+or start it from Python with `FakePiHole(latency=0.05).start()`.
+"""
+
+import json
+import threading
+import time
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SID = "benchmark-sid"
+
+REPLIES = (
+    "UNKNOWN NODATA NXDOMAIN CNAME IP DOMAIN RRNAME SERVFAIL REFUSED NOTIMP "
+    "OTHER DNSSEC NONE BLOB"
+).split()
+STATUSES = (
+    "UNKNOWN GRAVITY FORWARDED CACHE REGEX DENYLIST EXTERNAL_BLOCKED_IP "
+    "EXTERNAL_BLOCKED_NULL EXTERNAL_BLOCKED_NXRA GRAVITY_CNAME REGEX_CNAME "
+    "DENYLIST_CNAME RETRIED RETRIED_DNSSEC IN_PROGRESS DBBUSY SPECIAL_DOMAIN "
+    "CACHE_STALE EXTERNAL_BLOCKED_EDE15"
+).split()
+TYPES = (
+    "A AAAA ANY SRV SOA PTR TXT NAPTR MX DS RRSIG DNSKEY NS SVCB HTTPS OTHER".split()
+)
+
+
+def get_responses() -> dict:
+    """Get realistic responses of the API endpoints, keyed by query."""
+    now = int(time.time())
+    return {
+        "info/version": {
+            "version": {
+                component: {
+                    "local": {
+                        "branch": "master",
+                        "version": version,
+                        "hash": "f47b8ede",
+                    },
+                    "remote": {"version": version, "hash": "f47b8ede"},
+                }
+                for component, version in (
+                    ("core", "v6.4.3"),
+                    ("web", "v6.6"),
+                    ("ftl", "v6.7"),
+                )
+            }
+        },
+        "dns/blocking": {"blocking": "enabled", "timer": None},
+        "stats/summary": {
+            "queries": {
+                "total": 48213,
+                "blocked": 6120,
+                "percent_blocked": 12.693672038247049,
+                "unique_domains": 3112,
+                "forwarded": 20311,
+                "cached": 21702,
+                "frequency": 1.2,
+                "types": {name: i * 13 for i, name in enumerate(TYPES)},
+                "status": {name: i * 7 for i, name in enumerate(STATUSES)},
+                "replies": {name: i * 5 for i, name in enumerate(REPLIES)},
+            },
+            "clients": {"active": 14, "total": 21},
+            "gravity": {
+                "domains_being_blocked": 89947,
+                "last_update": now - 129_000,
+            },
+        },
+        "stats/recent_blocked": {"blocked": ["ssl.google-analytics.com"]},
+        "stats/top_clients": {
+            "clients": [
+                {"ip": f"192.168.1.{i}", "name": f"host{i}.lan", "count": 5000 // i}
+                for i in range(2, 12)
+            ],
+            "total_queries": 48213,
+            "blocked_queries": 6120,
+        },
+        "groups": {
+            "groups": [
+                {
+                    "name": name,
+                    "comment": comment,
+                    "enabled": True,
+                    "id": i,
+                    "date_added": now - 9_000_000,
+                    "date_modified": now - 86_400,
+                }
+                for i, (name, comment) in enumerate(
+                    (("Default", "The default group"), ("Kids", ""), ("IoT", "Cameras"))
+                )
+            ]
+        },
+        # A day of 10 minute intervals, busier during the day
+        "history": {
+            "history": [
+                {
+                    "timestamp": now - now % 600 - (143 - i) * 600,
+                    "total": 100 + (i * 37 % 50) + 300 * (36 <= i < 132),
+                    "cached": 40 + (i * 17 % 20),
+                    "blocked": 10 + (i * 23 % 30),
+                    "forwarded": 50 + (i * 29 % 40),
+                }
+                for i in range(144)
+            ]
+        },
+    }
+
+
+class FakePiHole(ThreadingHTTPServer):
+    """HTTP server answering like a Pi-hole v6, after sleeping for the given latency on every request."""
+
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 0.0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency = latency
+        self.responses = get_responses()
+        """Number of requests served, by method and path."""
+        self.requests = {}
+
+    @property
+    def addr(self) -> str:
+        """Get the address to pass to pihello."""
+        host, port = self.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self) -> "FakePiHole":
+        """Serve from a background thread."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, don't let them wait for delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self, status: int, data=None):
+        server = self.server
+        key = f"{self.command} {self.path}"
+        server.requests[key] = server.requests.get(key, 0) + 1
+        time.sleep(server.latency)
+
+        body = b"" if data is None else json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        session = {"valid": True, "totp": False, "sid": SID, "validity": 1800}
+        self._respond(200, {"session": session, "took": 0.001})
+
+    def do_DELETE(self):
+        self._respond(204)
+
+    def do_GET(self):
+        if self.headers.get("sid") != SID:
+            self._respond(401, {"error": {"key": "unauthorized"}})
+            return
+        query = self.path.partition("/api/")[2].partition("?")[0]
+        if query in self.server.responses:
+            self._respond(200, self.server.responses[query])
+        else:
+            self._respond(404, {"error": {"key": "not_found"}})
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    args = parser.parse_args()
+    server = FakePiHole(args.port, args.latency)
+    print(f"Serving a fake Pi-hole on {server.addr}")
+    server.serve_forever()
@@ -0,0 +1,304 @@
+"""
+Benchmarks of the render pipeline and the API client.
+
+Run from the repository root with `python benchmarks/run.py -o results.json`
+and compare the JSON results between releases.
+"""
+
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+from unittest import mock
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from pihello import Console, __version__  # noqa: E402
+from pihello import cli  # noqa: E402
+from pihello.color import Color  # noqa: E402
+from pihello.color_tables import COLOR_NAMES  # noqa: E402
+from pihello.sparkline import sparkline  # noqa: E402
+from pihello.style import Style  # noqa: E402
+from pihello.variables import flatten_dict, get_rows, get_variables  # noqa: E402
+
+from fake_pihole import FakePiHole, get_responses  # noqa: E402
+
+BENCHMARKS = {}
+
+
+def benchmark(func):
+    """Register a benchmark. It's called with the options and returns the function to time."""
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def showcase_templates() -> list:
+    """Get the configurations from docs/SHOWCASE.md and docs/example.txt."""
+    showcase = (ROOT / "docs" / "SHOWCASE.md").read_text(encoding="utf-8")
+    templates = re.findall(r"```\n(.*?)```", showcase, re.S)
+    templates.append((ROOT / "docs" / "example.txt").read_text(encoding="utf-8"))
+    return templates
+
+
+def synthetic_template(tags: int, seed: int = 0) -> str:
+    """Build a template with the given number of style tags, each followed by a variable."""
+    rng = random.Random(seed)
+    names = list(COLOR_NAMES)
+    variables = [k for k, v in realistic_variables().items() if v is not None]
+    parts = []
+    for i in range(tags):
+        style = rng.choice(["", "bold ", "italic ", "underline "])
+        parts.append(f"[{style}{rng.choice(names)}]{{{rng.choice(variables)}}} ")
+        if i % 8 == 7:
+            parts.append("\n")
+    return "".join(parts)
+
+
+class ShowcaseVariables(dict):
+    """Variables which also have a placeholder value for the names used by older configurations."""
+
+    def get(self, key, default=None):
+        return super().get(key, "0")
+
+
+def realistic_variables() -> dict:
+    return ShowcaseVariables(get_variables(get_responses()))
+
+
+def oversized_payload(keys: int) -> dict:
+    """Build a nested API-like response with about the given number of leaf keys."""
+    return {
+        f"group{i}": {
+            f"sub{j}": {f"key{k}": i * j * k for k in range(10)} for j in range(10)
+        }
+        for i in range(max(1, keys // 100))
+    }
+
+
+@benchmark
+def parse_default(opts):
+    console = Console(variables=realistic_variables())
+    return lambda: console.parse(cli.DEFAULT_CONTENT)
+
+
+@benchmark
+def parse_showcase(opts):
+    console = Console(variables=realistic_variables())
+    templates = showcase_templates()
+    return lambda: [console.parse(template) for template in templates]
+
+
+@benchmark
+def parse_10k_tags(opts):
+    console = Console(variables=realistic_variables())
+    template = synthetic_template(10_000)
+    return lambda: console.parse(template)
+
+
+@benchmark
+def render_10k_tags(opts):
+    console = Console(variables=realistic_variables())
+    template = console.compile(synthetic_template(10_000))
+    return lambda: template.render(console.variables)
+
+
+@benchmark
+def render_many_clients(opts):
+    responses = get_responses()
+    console = Console(variables=get_variables(responses))
+    template = console.compile(
+        "[bold]{client.rank}. {client.name}[] ({client.ip})\n"
+        "{client.count} of {queries.total} queries ([steelblue]{client.percent}%[])"
+    )
+    rows = get_rows(responses, "clients") * 10
+    return lambda: list(console.render_many(template, rows=rows))
+
+
+@benchmark
+def sparkline_week(opts):
+    # A week of 10 minute intervals, drawn without the memoization
+    history = get_responses()["history"]["history"] * 7
+    values = tuple(entry["total"] for entry in history)
+    return lambda: sparkline.__wrapped__(values, 80)
+
+
+@benchmark
+def style_get_state(opts):
+    # What Template.compile() resolves every tag to, without the memoization of get_sgr_state()
+    tags = re.findall(r"\[[^\]]*\]", synthetic_template(1_000))
+    return lambda: [Style(tag).get_state() for tag in tags]
+
+
+@benchmark
+def color_parse(opts):
+    names = list(COLOR_NAMES) + ["#5f87af", "rgb(95, 135, 175)", "color(67)"]
+    return lambda: [Color.parse(name) for name in names]
+
+
+@benchmark
+def color_parse_uncached(opts):
+    names = list(COLOR_NAMES) + ["#5f87af", "rgb(95, 135, 175)", "color(67)"]
+    parse = Color.parse.__wrapped__
+    return lambda: [parse(Color, name) for name in names]
+
+
+@benchmark
+def flatten_dict_summary(opts):
+    summary = get_responses()["stats/summary"]
+    return lambda: flatten_dict(summary)
+
+
+@benchmark
+def flatten_dict_oversized(opts):
+    payload = oversized_payload(10_000)
+    return lambda: flatten_dict(payload)
+
+
+@benchmark
+def get_variables_default(opts):
+    responses = get_responses()
+    names = Console().compile(cli.DEFAULT_CONTENT).variables
+
+    def run():
+        variables = get_variables(responses)
+        return [variables[name] for name in names]
+
+    return run
+
+
+@benchmark
+def get_variables_oversized(opts):
+    responses = {"stats/summary": oversized_payload(10_000)}
+    names = ("group7.sub3.key5", "group42.sub9.key1", "group99.sub0.key0")
+
+    def run():
+        variables = get_variables(responses)
+        return [variables[name] for name in names]
+
+    return run
+
+
+@benchmark
+def main_end_to_end(opts):
+    server = FakePiHole(latency=opts.latency).start()
+    argv = ["pihello", server.addr, "password"]
+
+    def run():
+        with mock.patch.object(sys, "argv", argv), contextlib.redirect_stdout(
+            io.StringIO()
+        ):
+            cli.main()
+
+    run.cleanup = server.stop
+    return run
+
+
+@benchmark
+def main_replay(opts):
+    snapshot = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+    with snapshot:
+        json.dump({"fetched": time.time(), "responses": get_responses()}, snapshot)
+    argv = ["pihello", "--replay", snapshot.name]
+
+    def run():
+        with mock.patch.object(sys, "argv", argv), contextlib.redirect_stdout(
+            io.StringIO()
+        ):
+            cli.main()
+
+    run.cleanup = lambda: os.unlink(snapshot.name)
+    return run
+
+
+def measure(func, repeat: int, min_time: float) -> dict:
+    """Time the function, calling it in batches that take at least min_time seconds."""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number *= 10
+
+    times = [elapsed / number]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - started) / number)
+
+    return {
+        "loops": number,
+        "repeat": repeat,
+        "best_s": min(times),
+        "median_s": statistics.median(times),
+        "mean_s": statistics.mean(times),
+        "stdev_s": statistics.stdev(times) if len(times) > 1 else 0.0,
+    }
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-o", "--output", help="write the JSON results to a file")
+    parser.add_argument(
+        "-k", "--only", help="only run the benchmarks whose name contains this"
+    )
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.2,
+        help="minimum seconds per batch of calls (default: 0.2)",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="seconds the fake Pi-hole waits before every response (default: 0)",
+    )
+    opts = parser.parse_args()
+
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if opts.only and opts.only not in name:
+            continue
+        func = setup(opts)
+        try:
+            results[name] = measure(func, opts.repeat, opts.min_time)
+        finally:
+            getattr(func, "cleanup", lambda: None)()
+        print(
+            f"{name:<28} {results[name]['best_s'] * 1e6:>14.1f} us",
+            file=sys.stderr,
+        )
+
+    report = {
+        "pihello": __version__,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "latency_s": opts.latency,
+        "results": results,
+    }
+    if opts.output:
+        with open(opts.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Startup regression check of the paths used from cron jobs and MOTD scripts.
+
+Runs each path in a fresh interpreter with `python -X importtime`, fails if it imports
+a module it doesn't need and reports how long its imports took. Run from the repository
+root with `python benchmarks/startup.py`, optionally with `--max-ms` as a time budget.
+"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from pihello.cache import ResponseCache  # noqa: E402
+
+from fake_pihole import get_responses  # noqa: E402
+
+RE_IMPORT = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+# Modules which only fetching from the Pi-hole or rendering needs
+NETWORK = ("ssl", "http.client", "concurrent.futures", "pihello.client")
+RENDERING = ("pihello.console", "pihello.color_tables", "unicodedata")
+
+# Command line and the modules it must not import, by scenario
+SCENARIOS = {
+    "version": (["--version"], NETWORK + RENDERING + ("pihello.cache", "json")),
+    "replay": (["--replay", "{snapshot}"], NETWORK + ("pihello.cache",)),
+    "cached": (["127.0.0.1:9", "password", "--cache"], NETWORK),
+}
+
+
+def run_scenario(argv: list) -> list:
+    """Run pihello with the arguments in a fresh interpreter and get its imports as (module, microseconds, top level)."""
+    code = (
+        "import sys; sys.argv = ['pihello'] + sys.argv[1:]\n"
+        "from pihello.cli import main\n"
+        "try:\n"
+        "    main()\n"
+        "except SystemExit as e:\n"
+        "    sys.exit(e.code)\n"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code, *argv],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    if proc.returncode:
+        raise RuntimeError(f"pihello {' '.join(argv)} failed:\n{proc.stderr}")
+
+    imports = []
+    for line in proc.stderr.splitlines():
+        match = RE_IMPORT.match(line)
+        if match:
+            _, cumulative, indent, name = match.groups()
+            imports.append((name, int(cumulative), not indent))
+    return imports
+
+
+def pihello_time(imports: list) -> int:
+    """Get the microseconds spent importing pihello and everything it needs, but not the interpreter's own startup."""
+    names = [name for name, _, _ in imports]
+    first = next(i for i, name in enumerate(names) if name.startswith("pihello"))
+    # Modules imported by pihello are nested under it, unless they're imported lazily
+    return sum(us for _, us, top in imports[first:] if top)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-o", "--output", help="write the JSON results to a file")
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        help="fail if the imports of pihello take longer than this in any scenario",
+    )
+    opts = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["XDG_CACHE_HOME"] = tmp
+        os.environ["PYTHONPATH"] = str(ROOT)
+        snapshot = os.path.join(tmp, "snapshot.json")
+        with open(snapshot, "w") as f:
+            json.dump({"fetched": time.time(), "responses": get_responses()}, f)
+        ResponseCache("http://127.0.0.1:9").update(get_responses())
+
+        results = {}
+        failures = []
+        for name, (argv, forbidden) in SCENARIOS.items():
+            argv = [arg.format(snapshot=snapshot) for arg in argv]
+            runs = [run_scenario(argv) for _ in range(opts.repeat)]
+            best_ms = min(map(pihello_time, runs)) / 1000
+            modules = {module for module, _, _ in runs[0]}
+            imported = sorted(modules.intersection(forbidden))
+            results[name] = {
+                "argv": argv,
+                "best_ms": best_ms,
+                "modules": len(modules),
+                "forbidden_imports": imported,
+            }
+            print(
+                f"{name:<10} {best_ms:>8.1f} ms {len(modules):>5} modules",
+                file=sys.stderr,
+            )
+            if imported:
+                failures.append(f"{name}: imports {', '.join(imported)}")
+            if opts.max_ms is not None and best_ms > opts.max_ms:
+                failures.append(
+                    f"{name}: imports took {best_ms:.1f} ms, more than {opts.max_ms} ms"
+                )
+
+    report = {"python": sys.version.split()[0], "results": results}
+    if opts.output:
+        with open(opts.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,16 @@
-from .console import Console
-
+__all__ = ["Console", "Template"]
 __version__ = "1.0.0"
+
+# Console and Template are imported on first use, so `pihello --version` and
+# the other paths which don't render anything start up without loading them.
+_LAZY = {"Console": ".console", "Template": ".template"}
+
+
+def __getattr__(name: str):
+    if name in _LAZY:
+        from importlib import import_module
+
+        value = getattr(import_module(_LAZY[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,130 @@
+from functools import lru_cache
+from typing import FrozenSet, Iterable, List, NamedTuple, Tuple
+
+# Codes which turn each text attribute off again. Attributes without one can only be removed by a reset.
+ATTRIBUTE_OFF = {
+    "1": "22",
+    "2": "22",
+    "3": "23",
+    "4": "24",
+    "21": "24",
+    "5": "25",
+    "6": "25",
+    "9": "29",
+}
+FOREGROUND = {str(code) for code in (*range(30, 38), *range(90, 98))}
+BACKGROUND = {str(code) for code in (*range(40, 48), *range(100, 108))}
+
+
+class SGRState(NamedTuple):
+    """The Select Graphic Rendition state of a terminal: its text attributes and colors."""
+
+    """Codes of the text attributes which are on, such as "1" for bold."""
+    attributes: FrozenSet[str] = frozenset()
+    """Codes of the colors, empty for the default color."""
+    foreground: Tuple[str, ...] = ()
+    background: Tuple[str, ...] = ()
+    underline: Tuple[str, ...] = ()
+
+    def codes(self) -> List[str]:
+        """Get the codes which set this state, starting from the default state."""
+        return [
+            *sorted(self.attributes),
+            *self.foreground,
+            *self.background,
+            *self.underline,
+        ]
+
+    def apply(self, codes: Iterable[str]) -> "SGRState":
+        """Get the state after the terminal received an SGR sequence with the given codes."""
+        attributes = set(self.attributes)
+        foreground, background, underline = (
+            self.foreground,
+            self.background,
+            self.underline,
+        )
+        codes = list(codes) or ["0"]
+        i = 0
+        while i < len(codes):
+            code = codes[i] or "0"
+            if code == "0":
+                attributes = set()
+                foreground = background = underline = ()
+            elif code in ("38", "48", "58"):
+                # Extended color: 38;5;n or 38;2;r;g;b
+                size = 3 if codes[i + 1 : i + 2] == ["5"] else 5
+                color = tuple(codes[i : i + size])
+                i += size - 1
+                if code == "38":
+                    foreground = color
+                elif code == "48":
+                    background = color
+                else:
+                    underline = color
+            elif code == "39":
+                foreground = ()
+            elif code == "49":
+                background = ()
+            elif code == "59":
+                underline = ()
+            elif code in FOREGROUND:
+                foreground = (code,)
+            elif code in BACKGROUND:
+                background = (code,)
+            elif code in ATTRIBUTE_OFF.values():
+                attributes = {a for a in attributes if ATTRIBUTE_OFF.get(a) != code}
+            else:
+                attributes.add(code)
+            i += 1
+        return SGRState(frozenset(attributes), foreground, background, underline)
+
+
+DEFAULT = SGRState()
+
+
+@lru_cache(maxsize=1024)
+def sequence(state: SGRState) -> str:
+    """Get the escape sequence which resets the terminal and then sets the state."""
+    return "\x1b[" + ";".join(["0"] + state.codes()) + "m"
+
+
+@lru_cache(maxsize=4096)
+def transition(current: SGRState, target: SGRState) -> str:
+    """
+    Get the shortest escape sequence which changes the current SGR state into the target state.
+
+    This is either nothing, a reset, the codes which differ, or a reset followed by the target codes.
+    """
+    if current == target:
+        return ""
+    if target == DEFAULT:
+        return "\x1b[0m"
+
+    if current.attributes <= target.attributes:
+        codes = sorted(target.attributes - current.attributes)
+    else:
+        removed = current.attributes - target.attributes
+        if not removed <= ATTRIBUTE_OFF.keys():
+            return sequence(target)
+        # Some off codes turn off two attributes at once, those still wanted are set again
+        off = {ATTRIBUTE_OFF[attribute] for attribute in removed}
+        codes = sorted(off)
+        codes.extend(
+            sorted(
+                attribute
+                for attribute in target.attributes
+                if attribute not in current.attributes
+                or ATTRIBUTE_OFF.get(attribute) in off
+            )
+        )
+
+    if current.foreground != target.foreground:
+        codes.extend(target.foreground or ("39",))
+    if current.background != target.background:
+        codes.extend(target.background or ("49",))
+    if current.underline != target.underline:
+        codes.extend(target.underline or ("59",))
+
+    changes = "\x1b[" + ";".join(codes) + "m"
+    reset = sequence(target)
+    return changes if len(changes) < len(reset) else reset
@@ -0,0 +1,227 @@
+import json
+import os
+import re
+import time
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+from . import __version__
+from .color import ColorSystem
+from .template import Template
+
+
+def cache_dir() -> Path:
+    """Get the pihello cache directory, following the XDG base directory specification."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return Path(base) / "pihello"
+
+
+def load_json(path: Path) -> dict:
+    """Load a JSON cache file. Missing or corrupt files are treated as empty."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def write_json(path: Path, data: dict):
+    """Atomically replace a cache file with the given data. The file is only readable by its owner."""
+    import tempfile
+
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    # Unique, so concurrent writers don't rename each other's file
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with open(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+@contextmanager
+def locked(path: Path) -> Iterator[None]:
+    """
+    Hold an exclusive lock of a cache file while it's read, modified and written.
+
+    The lock is held against other threads as well as other processes. Where there is no
+    fcntl, e.g. on Windows, the last writer wins.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    fd = os.open(path.with_name(f".{path.name}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+class SessionCache:
+    """On-disk store of authenticated Pi-hole sessions, keyed by the Pi-hole's URL."""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or cache_dir() / "sessions.json"
+
+    def get(self, url: str) -> dict:
+        """Get the session stored for the Pi-hole as {"sid", "validity", "expires"}, unless it has expired."""
+        entry = load_json(self.path).get(url, {})
+        # Leave a margin so the session doesn't expire mid-run
+        if entry.get("sid") and entry.get("expires", 0) - 10 > time.time():
+            return entry
+        return {}
+
+    def set(self, url: str, sid: str, validity: int, last_used: float):
+        """Store the session id of the Pi-hole and when it will expire."""
+        with locked(self.path):
+            sessions = load_json(self.path)
+            sessions[url] = {
+                "sid": sid,
+                "validity": validity,
+                "expires": last_used + validity,
+            }
+            write_json(self.path, sessions)
+
+    def delete(self, url: str):
+        """Forget the session of the Pi-hole."""
+        with locked(self.path):
+            sessions = load_json(self.path)
+            if sessions.pop(url, None) is not None:
+                write_json(self.path, sessions)
+
+
+# Seconds the responses of each API endpoint stay fresh
+DEFAULT_TTLS = {
+    "info/version": 6 * 3600,
+    "dns/blocking": 5,
+    "stats/summary": 10,
+    "stats/recent_blocked": 10,
+    "stats/top_clients": 10,
+    "groups": 60,
+    "history": 60,
+}
+
+
+class ResponseCache:
+    """On-disk cache of the API responses of a Pi-hole, each endpoint with its own time to live."""
+
+    def __init__(
+        self, url: str, ttls: dict = DEFAULT_TTLS, path: Optional[Path] = None
+    ):
+        self.url = url
+        self.ttls = ttls
+        name = re.sub(r"[^\w.-]", "_", url)
+        self.path = path or cache_dir() / "responses" / f"{name}.json"
+
+    def lookup(self, queries: tuple, stale: bool = False) -> tuple:
+        """
+        Get the cached responses of the given endpoints.
+
+        Returns a tuple of (responses, expired) where responses only contains fresh responses,
+        unless stale is set, and expired lists the queries whose response is served stale.
+        """
+        entries = load_json(self.path)
+        now = time.time()
+        responses = {}
+        expired = []
+        for query in queries:
+            entry = entries.get(query)
+            # Entries which aren't ours are skipped, the fallback of --deadline mustn't fail the run
+            valid = isinstance(entry, dict) and "data" in entry
+            if not valid or not isinstance(entry.get("fetched"), (int, float)):
+                continue
+            if entry["fetched"] + self.ttls.get(query, 0) > now:
+                responses[query] = entry["data"]
+            elif stale:
+                responses[query] = entry["data"]
+                expired.append(query)
+        return responses, tuple(expired)
+
+    def update(self, responses: dict):
+        """Store freshly fetched responses. They aren't cached if the cache can't be written."""
+        entries = load_json(self.path)
+        now = time.time()
+        for query, data in responses.items():
+            entries[query] = {"fetched": now, "data": data}
+        try:
+            write_json(self.path, entries)
+        except OSError:
+            pass  # The cache is only an optimization, e.g. the home may be read-only
+
+
+class TemplateCache:
+    """
+    On-disk cache of compiled templates, keyed by the path of the template file.
+
+    A compiled template is reused as long as the file has the same modification time
+    and content checksum, and was compiled for the same color system by the same version of pihello.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or cache_dir() / "templates"
+
+    def compile(
+        self, path: str, color_system: ColorSystem = ColorSystem.TRUECOLOR
+    ) -> Template:
+        """Compile the template file, or load it as compiled by an earlier run if it hasn't changed since."""
+        with open(path) as f:
+            mtime = os.fstat(f.fileno()).st_mtime_ns
+            content = f.read()
+
+        key = {
+            "mtime": mtime,
+            # CRC-32 is plenty to notice an edit, without the import time of hashlib
+            "crc32": zlib.crc32(content.encode("utf-8")),
+            "colors": color_system.value,
+            "version": __version__,
+        }
+        name = re.sub(r"[^\w.-]", "_", os.path.abspath(path))
+        entry_path = self.path / f"{name}.json"
+        entry = load_json(entry_path)
+        if entry.get("key") == key:
+            try:
+                return Template.from_dict(entry["template"])
+            except (KeyError, TypeError, ValueError):
+                pass  # Corrupt entry, compile the template again
+
+        template = Template.compile(content, color_system)
+        try:
+            write_json(entry_path, {"key": key, "template": template.to_dict()})
+        except OSError:
+            pass  # The cache is only an optimization, e.g. the home may be read-only
+        return template
+
+
+class OutputCache:
+    """
+    On-disk record of what each output showed the last time it was written, keyed by template and destination.
+
+    Stores a digest of the values it showed and one of each of its lines, so a run can tell
+    whether the output changed without rendering it, and which of its lines did.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or cache_dir() / "outputs.json"
+
+    def get(self, key: str) -> dict:
+        """Get the record of the output as {"values", "lines"}, empty if it wasn't written before."""
+        entry = load_json(self.path).get(key)
+        return entry if isinstance(entry, dict) else {}
+
+    def set(self, key: str, values: str, lines: list):
+        """Store the digests of the values and of the lines the output shows now."""
+        with locked(self.path):
+            entries = load_json(self.path)
+            entries[key] = {"values": values, "lines": lines}
+            write_json(self.path, entries)
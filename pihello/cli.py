@@ -1,16 +1,59 @@
+import os
+import re
 import sys
-import json
-import ssl
-from urllib import request, error
-from datetime import datetime, timezone
+import time
 from argparse import ArgumentParser
-from pihello import Console, __version__
+from contextlib import nullcontext
+from datetime import datetime
+from typing import TYPE_CHECKING, Optional
+from pihello import __version__
+from pihello.color import COLOR_SYSTEM_NAMES, ColorSystem
+from pihello.hosts import (
+    Host,
+    HostsParseError,
+    aggregate,
+    get_host_endpoints,
+    load_hosts,
+)
+from pihello.outputs import (
+    Output,
+    OutputParseError,
+    get_changed_lines,
+    get_line_digests,
+    get_values_digest,
+    parse_output,
+    write_file,
+)
+from pihello.timing import Deadline, Timings
+from pihello.variables import (
+    ENDPOINTS,
+    ROWS,
+    Variables,
+    get_counters,
+    get_endpoints,
+    get_rows,
+    get_variables,
+)
+
+# The rest is imported where it's needed, so paths which don't render, don't fetch or
+# hit the cache don't pay for loading the HTTP, TLS and threading modules.
+if TYPE_CHECKING:
+    from pihello.cache import ResponseCache
+    from pihello.client import PiHoleClient, PiHoleError
+    from pihello.console import Console
+    from pihello.history import History
+
+
+# Exit code of --if-changed when none of the outputs changed
+UNCHANGED = 3
 
 
 def get_args():
     parser = ArgumentParser(prog="pihello")
-    parser.add_argument("addr", help="the address of your Pi-hole")
-    parser.add_argument("password", help="your Pi-hole app password from settings")
+    parser.add_argument("addr", help="the address of your Pi-hole", nargs="?")
+    parser.add_argument(
+        "password", help="your Pi-hole app password from settings", nargs="?"
+    )
     parser.add_argument("-v", "--version", action="version", version=__version__)
     parser.add_argument(
         "-i",
@@ -63,151 +106,952 @@ def get_args():
         help="skip TLS certificate verification (for self-signed Pi-hole certs)",
         action="store_true",
     )
+    parser.add_argument(
+        "-s",
+        "--session-cache",
+        help="reuse the API session across runs instead of logging in and out every time",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-C",
+        "--cache",
+        help="cache the API responses for a few seconds (hours for versions)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--stale",
+        help="use expired cached responses right away and refresh them in the background",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--history",
+        help="keep the samples behind the *.rate_1m, *.rate_5m and *.delta variables between runs",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--timeout",
+        help="give up on connecting to or reading from the Pi-hole after SECONDS (0 = no limit). (default: 5)",
+        metavar="SECONDS",
+        default=5,
+        type=float,
+    )
+    parser.add_argument(
+        "--deadline",
+        help="give up on the Pi-hole after SECONDS in total and show the last responses it sent instead",
+        metavar="SECONDS",
+        type=float,
+    )
+    parser.add_argument(
+        "--colors",
+        help="set the colors of the terminal (default: detected from $COLORTERM and $TERM)",
+        choices=COLOR_SYSTEM_NAMES,
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "-w",
+        "--watch",
+        help="keep running and update the output every SECONDS",
+        metavar="SECONDS",
+        type=float,
+    )
+    mode.add_argument(
+        "--record",
+        help="save the API responses to a snapshot FILE",
+        metavar="FILE",
+    )
+    mode.add_argument(
+        "--replay",
+        help="render from a snapshot FILE instead of contacting the Pi-hole",
+        metavar="FILE",
+    )
+    mode.add_argument(
+        "--serve",
+        help="run a daemon which renders for --client, sharing one API session",
+        action="store_true",
+    )
+    mode.add_argument(
+        "--client",
+        help="let the --serve daemon render the output, or run as usual if it isn't running",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--socket",
+        help="set the Unix socket of the daemon, which other users can connect to as well "
+        "(default: a private $XDG_RUNTIME_DIR/pihello.sock or /tmp/pihello-UID/pihello.sock)",
+        metavar="PATH",
+    )
+    parser.add_argument(
+        "--timings",
+        help="report how long each phase of the run took on stderr, as text or JSON",
+        nargs="?",
+        const="text",
+        choices=("text", "json"),
+    )
+    parser.add_argument(
+        "--output",
+        help="render the TEMPLATE file (empty for the default) to DEST (- for stdout) with "
+        "its own OPTIONS, e.g. width=40,height=0,colors=none,clip. Can be repeated",
+        metavar="TEMPLATE:DEST[:OPTIONS]",
+        action="append",
+        default=[],
+    )
+    parser.add_argument(
+        "--if-changed",
+        help=f"only render and write the output if the values it shows changed since the last run, "
+        f"exit with {UNCHANGED} otherwise",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--changed-lines",
+        help="with --if-changed, print the destination and the numbers of the lines which changed to stderr",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--each",
+        help="render a report for each of the top clients or each group instead of a single output",
+        choices=tuple(ROWS),
+    )
+    parser.add_argument(
+        "--dest",
+        help="write each report of --each to its own file, e.g. reports/{client.ip}.txt",
+        metavar="PATTERN",
+    )
+    parser.add_argument(
+        "--separator",
+        help="print a line with TEXT between the reports of --each (default: an empty line)",
+        metavar="TEXT",
+        default="",
+    )
+    parser.add_argument(
+        "--hosts",
+        help="query all the Pi-holes listed in an INI file instead of a single one",
+        metavar="FILE",
+    )
     args = parser.parse_args()
+    if args.deadline is not None and args.deadline <= 0:
+        parser.error("the deadline must be more than 0 seconds")
+    if args.watch is not None and args.watch <= 0:
+        parser.error("the watch interval must be more than 0 seconds")
+    if args.each and (args.watch or args.serve or args.client):
+        parser.error("--each can't be combined with --watch, --serve or --client")
+    if args.dest and not args.each:
+        parser.error("--dest requires --each")
+    if args.output and (args.file or args.each or args.serve or args.client):
+        parser.error("--output can't be combined with -f, --each, --serve or --client")
+    if args.history and (args.replay or args.client):
+        parser.error("--history can't be combined with --replay or --client")
+    if args.if_changed and (args.each or args.watch or args.serve or args.client):
+        parser.error(
+            "--if-changed can't be combined with --each, --watch, --serve or --client"
+        )
+    if args.changed_lines and not args.if_changed:
+        parser.error("--changed-lines requires --if-changed")
+    defaults = Output(
+        args.file or "",
+        "-",
+        args.width,
+        args.height,
+        args.colors,
+        args.clip,
+        args.indent,
+    )
+    try:
+        args.output = [parse_output(spec, defaults) for spec in args.output] or [
+            defaults
+        ]
+    except OutputParseError as e:
+        parser.error(str(e))
+    if args.replay:
+        from pihello.snapshot import SnapshotError, load_snapshot
+
+        try:
+            args.replay = load_snapshot(args.replay)
+        except SnapshotError as e:
+            parser.error(str(e))
+        return args
+    if args.client and not args.hosts and not args.addr:
+        return args  # Without a Pi-hole to fall back on
+    if not args.hosts and not (args.addr and args.password):
+        parser.error("the address and password of a Pi-hole or --hosts are required")
+    if args.hosts:
+        try:
+            args.hosts = load_hosts(args.hosts)
+        except (OSError, HostsParseError) as e:
+            parser.error(f"could not load the hosts: {e}")
     return args
 
 
-def flatten_dict(d, tld="") -> dict:
-    """Flatten the given dict recursively while prepending the upper level key to all the lower level keys separated by a dot (.)"""
-    new_dict = {}
-    for k, v in d.items():
-        if isinstance(v, dict):
-            lower = flatten_dict(v, tld=f"{tld}{k}.")
-            new_dict.update(lower)
+DEFAULT_CONTENT = """\
+[cyan2]─────────────────────────────────────────────────────[]
+[white]PiHole[] ([green4]{blocking}[]) [lightgreen]{version.core.local.version}[white], Web [lightgreen]{version.web.local.version}[white], FTL [lightgreen]{version.ftl.local.version}
+[cyan2]─────────────────────────────────────────────────────[]
+Blocking [darkcyan]{gravity.domains_being_blocked}[] domains for [steelblue]{clients.active}[] clients
+Blocked [fuchsia]{queries.blocked}[] out of [lightgreen]{queries.total}[] queries [underline]today[] ([steelblue]{queries.percent_blocked}%[])
+[grey37]Gravity last updated [bold grey50]{gravity.relative.days}[grey37] days [bold grey50]{gravity.relative.hours}[grey37] hours and [bold grey50]{gravity.relative.minutes}[grey37] minutes ago\
+"""
+
+
+def get_hosts_content(hosts: list) -> str:
+    """Build the default output config for several Pi-holes."""
+    rule = "[cyan2]─────────────────────────────────────────────────────[]"
+    lines = [rule]
+    for host in hosts:
+        label = host.name.replace("[", "\\[").replace("{", "\\{")
+        var = f"hosts.{host.name}"
+        lines.append(
+            f"[white]{label}[] ([green4]{{{var}.blocking}}[]) "
+            f"Blocked [fuchsia]{{{var}.queries.blocked}}[] out of "
+            f"[lightgreen]{{{var}.queries.total}}[] queries"
+        )
+    lines.append(rule)
+    lines.append(
+        "[white]Total[] Blocked [fuchsia]{all.queries.blocked}[] out of "
+        "[lightgreen]{all.queries.total}[] queries [underline]today[] "
+        "([steelblue]{all.queries.percent_blocked}%[])"
+    )
+    return "\n".join(lines)
+
+
+def main():
+    timings = Timings()
+    args = get_args()
+    deadline = Deadline(args.deadline)
+    if args.client:
+        output = render_remote(args, deadline)
+        if output is not None:
+            print(output, end="")
+            return
+
+    if args.replay:
+        responses, fetched = args.replay
+        hosts = [Host(name, "", "") for name in responses]
+    elif args.hosts:
+        hosts = args.hosts
+    else:
+        hosts = [Host("", args.addr, args.password, args.proto, args.insecure)]
+    multiple = hosts[0].name != ""
+
+    if args.serve:
+        serve(args, hosts, deadline)
+        return
+
+    with timings.phase("parse"):
+        targets = get_targets(args.output, hosts)
+    # Every output is rendered from the same responses
+    names = tuple(
+        dict.fromkeys(name for _, _, template in targets for name in template.variables)
+    )
+    history = get_history(args, hosts) if get_counters(names) else None
+
+    if args.replay:
+        with timings.phase("variables"):
+            variables = get_all_variables(responses, now=fetched)
+            if history is not None:
+                variables = history.update(variables, names, record=False)
+        status = show(
+            args,
+            targets,
+            variables,
+            timings,
+            rows=get_each_rows(args, responses),
+            hosts=hosts,
+        )
+        if status:
+            sys.exit(status)
+        return
+
+    if args.record:
+        # Record everything, so the snapshot can be replayed with any template
+        queries = {host.name: tuple(ENDPOINTS) for host in hosts}
+    elif multiple:
+        queries = get_host_endpoints(names, hosts)
+    else:
+        queries = {"": get_endpoints(names)}
+    if args.each:
+        query = ROWS[args.each][0]
+        queries = {
+            name: host_queries + (query,) if query not in host_queries else host_queries
+            for name, host_queries in queries.items()
+        }
+
+    if args.watch:
+        watch(args, targets, hosts, queries, timings, deadline, names, history)
+        if args.timings:
+            print(timings.report(args.timings), file=sys.stderr)
+        return
+
+    responses = {host.name: {} for host in hosts}
+    expired = {}
+    if args.cache or args.stale:
+        with timings.phase("cache"):
+            for host in hosts:
+                cached, stale = get_cache(host).lookup(
+                    queries[host.name], stale=args.stale
+                )
+                responses[host.name].update(cached)
+                if stale:
+                    expired[host.name] = stale
+
+    missing = {
+        name: tuple(query for query in queries[name] if query not in responses[name])
+        for name in responses
+    }
+    # With a deadline, the responses are kept to fall back on when the Pi-hole is too slow
+    cache = args.cache or args.stale or args.deadline is not None
+    fetched = for_hosts(
+        lambda host: fetch(args, host, missing[host.name], cache, timings, deadline),
+        [host for host in hosts if missing[host.name]],
+    )
+    stale = bool(expired)
+    for name, (host_responses, host_stale) in fetched.items():
+        responses[name].update(host_responses)
+        stale = stale or host_stale
+    with timings.phase("variables"):
+        variables = get_all_variables(responses)
+        if history is not None:
+            # Stale values were sampled when they were fetched
+            variables = history.update(variables, names, record=not stale)
+            history.close()
+
+    if args.record:
+        from pihello.snapshot import save_snapshot
+
+        save_snapshot(args.record, responses)
+    status = show(
+        args,
+        targets,
+        variables,
+        timings,
+        stale,
+        get_each_rows(args, responses),
+        hosts,
+    )
+
+    # Even if nothing changed, otherwise the expired responses would be shown forever
+    if expired:
+        revalidate(args, [host for host in hosts if host.name in expired], expired)
+    if status:
+        sys.exit(status)
+
+
+def get_targets(outputs: list, hosts: list) -> list:
+    """Create a console for each output and compile its template. Returns a list of (output, console, template)."""
+    from pihello.console import Console
+
+    multiple = hosts[0].name != ""
+    targets = []
+    for output in outputs:
+        console = Console(
+            output.width,
+            output.height,
+            tab_size=output.indent,
+            clip=output.clip,
+            color_system=get_color_system(output),
+        )
+        if output.template:
+            from pihello.cache import TemplateCache
+
+            template = TemplateCache().compile(output.template, console.color_system)
+        elif multiple:
+            template = console.compile(get_hosts_content(hosts))
         else:
-            key = tld + k
-            new_dict[key] = v
+            template = console.compile(DEFAULT_CONTENT)
+        targets.append((output, console, template))
+    return targets
+
+
+def get_color_system(args) -> ColorSystem:
+    """Get the color system chosen with --colors, or detected from the environment."""
+    return ColorSystem.parse(args.colors) if args.colors else ColorSystem.detect()
+
+
+def get_all_variables(responses: dict, now: Optional[float] = None) -> dict:
+    """Turn the API responses of each Pi-hole into template variables."""
+    if set(responses) == {""}:
+        return get_variables(responses[""], now)
+    return aggregate(
+        {name: get_variables(data, now) for name, data in responses.items()}, now
+    )
 
-    return new_dict
 
+def get_history(args, hosts: list) -> "History":
+    """
+    Get the history of samples of the counters, kept in the cache directory with --history.
+
+    Every set of Pi-holes has a history of its own, their counters mustn't be mixed up.
+    """
+    from pihello.history import History
+
+    if not args.history:
+        return History()
+    from pihello.cache import cache_dir
+
+    urls = "+".join(
+        (
+            f"{host.name}={host.proto}://{host.addr}"
+            if host.name
+            else f"{host.proto}://{host.addr}"
+        )
+        for host in hosts
+    )
+    name = re.sub(r"[^\w.=+-]", "_", urls)
+    if len(name) > 128:
+        import zlib
+
+        # Room for the longest file names
+        name = f"{name[:119]}-{zlib.crc32(urls.encode('utf-8')):08x}"
+    return History(cache_dir() / "history" / name)
 
-def get_data(addr: str, sid: str, ctx: ssl.SSLContext, query: str = "") -> dict:
-    url = f"{addr}/api/{query}"
-    req = request.Request(url)
-    req.add_header("sid", sid)
-    with request.urlopen(req, context=ctx) as res:
-        raw = res.read()
+
+def get_cache(host: Host) -> "ResponseCache":
+    """Get the response cache of the Pi-hole."""
+    from pihello.cache import ResponseCache
+
+    return ResponseCache(f"{host.proto}://{host.addr}")
+
+
+def for_hosts(func, hosts: list) -> dict:
+    """Call the function for each of the Pi-holes concurrently and return the results keyed by host name."""
+    if not hosts:
+        return {}
+    if len(hosts) == 1:
+        return {hosts[0].name: func(hosts[0])}
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=len(hosts)) as pool:
+        return dict(zip((host.name for host in hosts), pool.map(func, hosts)))
+
+
+def show(
+    args,
+    targets: list,
+    variables,
+    timings: Timings,
+    stale: bool = False,
+    rows: Optional[list] = None,
+    hosts: tuple = (),
+) -> int:
+    """
+    Print or write the rendered outputs, or the reports of --each, followed by the --timings report on stderr.
+
+    Files are only written if their content changed. With --if-changed, outputs whose values
+    are the same as the last time they were shown for the same Pi-holes aren't rendered at all.
+    Returns the exit status: 1 if any of them couldn't be written, UNCHANGED if none of them
+    changed, else 0.
+    """
+    outputs = None
+    if args.if_changed:
+        from pihello.cache import OutputCache
+
+        outputs = OutputCache()
+        # Runs for other Pi-holes have other values, even with the same template and destination
+        sources = ",".join(f"{host.name}={host.proto}://{host.addr}" for host in hosts)
+
+    failed = False
+    unchanged = 0
+    for output, console, template in targets:
+        if rows is not None:
+            console.variables = variables
+            add_run_variables(console, template, timings, stale)
+            write_reports(args, console, template, rows, timings)
+            continue
+
+        if outputs is not None:
+            console.variables = variables
+            add_run_variables(console, template, timings, stale)
+            template_path = os.path.abspath(output.template) if output.template else ""
+            key = f"{sources} {template_path}:{output.dest}"
+            previous = outputs.get(key)
+            digest = get_values_digest(output, template, console.variables)
+            if digest == previous.get("values"):
+                unchanged += 1
+                continue
+
+        text = render_output(args, output, console, template, variables, timings, stale)
+        if output.dest == "-":
+            print(text, end="")
+        else:
+            try:
+                write_file(output.dest, text)
+            except OSError as e:
+                print(f"Could not write the output to {output.dest}: {e}")
+                failed = True
+                continue
+
+        if outputs is not None:
+            lines = get_line_digests(text)
+            if args.changed_lines:
+                changed = get_changed_lines(previous.get("lines", []), lines)
+                print(output.dest, *changed, file=sys.stderr)
+            try:
+                outputs.set(key, digest, lines)
+            except OSError:
+                pass  # Rendered again on the next run
+
+    if args.timings:
+        sys.stdout.flush()
+        print(timings.report(args.timings), file=sys.stderr)
+    if failed:
+        return 1
+    if targets and unchanged == len(targets):
+        return UNCHANGED
+    return 0
+
+
+def add_run_variables(
+    console: "Console", template, timings: Timings, stale: bool = False
+):
+    """
+    Make the variables about the run itself available, if the template uses them.
+
+    These are the timings of the phases finished so far as _timing.* and _stale, which is
+    "stale" if any of the responses are older than they should be and empty otherwise.
+    """
+    run = {}
+    if any(name.startswith("_timing.") for name in template.variables):
+        run.update(timings.variables())
+    if "_stale" in template.variables:
+        run["_stale"] = "stale" if stale else ""
+    if run:
+        console.variables = Variables(run, console.variables)
+
+
+def render_output(
+    args,
+    output: Output,
+    console: "Console",
+    template,
+    variables,
+    timings: Timings,
+    stale: bool = False,
+) -> str:
+    """Render the template of an output with the variables shared by all of them."""
+    console.variables = variables
+    add_run_variables(console, template, timings, stale)
+    with timings.phase("render"):
+        return render(args, console, template, "" if output.template else "\n")
+
+
+def render(args, console: "Console", template, end: str = "\n") -> str:
+    """Render the template, with the timestamp line if requested."""
+    return console.render(*get_objects(args, template), sep="\n", end=end)
+
+
+def get_objects(args, template) -> list:
+    """Get what to render: the template, preceded by the timestamp if requested."""
+    objects = [template]
+    if args.timestamp:
+        ts = (
+            datetime.now()
+            if isinstance(args.timestamp, bool)
+            else datetime.now().strftime(args.timestamp)
+        )
+        objects.insert(0, ts)
+    return objects
+
+
+def get_each_rows(args, responses: dict) -> Optional[list]:
+    """Get the rows of --each of every Pi-hole, None without --each. With several Pi-holes, each row also has the host variable."""
+    if not args.each:
+        return None
+    if set(responses) == {""}:
+        return get_rows(responses[""], args.each)
+    return [
+        {**row, "host": name}
+        for name, data in responses.items()
+        for row in get_rows(data, args.each)
+    ]
+
+
+def write_reports(args, console: "Console", template, rows: list, timings: Timings):
+    """Render the template once for every row of --each and write each report to its file, or print them all."""
+    end = "" if args.file else "\n"
+    with timings.phase("render"):
+        reports = list(
+            console.render_many(
+                *get_objects(args, template), rows=rows, sep="\n", end=end
+            )
+        )
+
+    if not args.dest:
+        text = ""
+        for report in reports:
+            if text:
+                # Whether a report of a configuration file ends with a newline is up to the file
+                text += ("" if text.endswith("\n") else "\n") + f"{args.separator}\n"
+            text += report
+        print(text, end="")
+        return
+
+    for row, report in zip(rows, reports):
         try:
-            return json.loads(raw)
-        except json.decoder.JSONDecodeError:
-            return raw.decode("utf-8")
-    return None
+            path = get_report_path(args.dest, Variables(row, console.variables))
+        except KeyError as e:
+            print(f"No variable {e} for the name of the report.")
+            sys.exit(1)
+        try:
+            write_file(path, report)
+        except OSError as e:
+            print(f"Could not write the report to {path}: {e}")
+            sys.exit(1)
+
 
+RE_VARIABLE = re.compile(r"\{([^{}]+)\}")
+RE_UNSAFE_NAME = re.compile(r"[^\w.@+-]")
 
-def auth(addr: str, password: str, ctx: ssl.SSLContext) -> str:
-    url = f"{addr}/api/auth"
-    data = {"password": password}
-    json_bytes = json.dumps(data).encode("utf-8")
 
-    req = request.Request(url, data=json_bytes, method="POST")
-    req.add_header("Content-Type", "application/json; charset=utf-8")
+def get_report_path(pattern: str, variables) -> str:
+    """Fill in the variables of the --dest pattern, replacing whatever isn't safe in a file name with "_"."""
+
+    def value(match) -> str:
+        val = variables.get(match.group(1))
+        if val is None:
+            raise KeyError(match.group(1))
+        name = RE_UNSAFE_NAME.sub(
+            "_", f"{val:.1f}" if isinstance(val, float) else str(val)
+        )
+        return "_" if name in ("", ".", "..") else name
+
+    return RE_VARIABLE.sub(value, pattern)
+
+
+# GET requests are tried this many more times before a run gives up on the Pi-hole
+RETRIES = 2
+
+
+def login(
+    args,
+    host: Host,
+    timings: Optional[Timings] = None,
+    deadline: Optional[Deadline] = None,
+) -> "PiHoleClient":
+    """Create a client with an authenticated session. Raises PiHoleError on failure."""
+    from pihello.cache import SessionCache
+    from pihello.client import PiHoleClient, PiHoleError
+
+    client = PiHoleClient(
+        host.addr,
+        host.password,
+        proto=host.proto,
+        insecure=host.insecure,
+        sessions=SessionCache() if args.session_cache else None,
+        timings=timings,
+        timeout=args.timeout or None,
+        retries=RETRIES,
+        deadline=deadline,
+    )
+
+    try:
+        client.login()
+    except PiHoleError:
+        client.close()
+        raise
+    if not client.sid:
+        client.close()
+        raise PiHoleError(f"{client.url}/api/auth: no session was created")
+    return client
+
+
+def connect(
+    args,
+    host: Host,
+    timings: Optional[Timings] = None,
+    deadline: Optional[Deadline] = None,
+) -> "PiHoleClient":
+    """Create a client with an authenticated session. Exits on failure."""
+    from pihello.client import PiHoleError
 
     try:
-        with request.urlopen(req, context=ctx) as response:
-            auth_response = json.loads(response.read().decode("utf-8"))
-        sid = auth_response.get("session", {}).get("sid")
-
-    except error.HTTPError as e:
-        print(f"\n[HTTP Error {e.code}]: {e.reason}")
-        error_details = e.read().decode("utf-8")
-        print(f"Server Message: {error_details}")
-        return ""
-    except Exception as e:
+        return login(args, host, timings, deadline)
+    except PiHoleError as e:
+        print_login_error(e)
+        sys.exit(1)
+
+
+def print_login_error(e: "PiHoleError"):
+    """Print why the Pi-hole couldn't be logged in to."""
+    if e.code is None:
         print(f"General failure: {e}")
-        return ""
-    return sid
+    else:
+        print(f"\n[{e}]")
+        print(f"Server Message: {e.details}")
+
+
+def disconnect(args, client: "PiHoleClient", quiet: bool = False):
+    """End the session, unless it's cached for the next run, and close the client."""
+    from pihello.client import PiHoleError
+
+    if not args.session_cache:
+        try:
+            client.logout()
+        except PiHoleError as e:
+            # The output has been shown by now, and a login banner with a deadline
+            # shouldn't end with an error about its session, which expires on its own
+            if not quiet and args.deadline is None:
+                print(f"Failed to logout: {e}", file=sys.stderr)
+    client.close()
 
 
-def logout(addr: str, sid: str, ctx: ssl.SSLContext) -> bool:
-    url = f"{addr}/api/auth"
+def fetch(
+    args,
+    host: Host,
+    queries: tuple,
+    cache: bool = False,
+    timings: Optional[Timings] = None,
+    deadline: Optional[Deadline] = None,
+) -> tuple:
+    """
+    Fetch the given API endpoints of the Pi-hole and return (responses, stale).
 
-    req = request.Request(url, method="DELETE")
-    req.add_header("sid", sid)
+    If the Pi-hole can't be reached or doesn't respond in time and cache is set, the last cached
+    responses are returned instead, with stale set. Exits on failure otherwise.
+    """
+    from pihello.client import PiHoleError
 
+    timings = timings or Timings()
     try:
-        with request.urlopen(req, context=ctx) as response:
-            # HTTP 204 (No Content) is a successful logout
-            return response.getcode() == 204
-    except Exception as e:
-        print(f"Failed to logout: {e}")
-        return False
+        client = login(args, host, timings, deadline)
+    except PiHoleError as e:
+        responses = get_last_responses(host, queries, e) if cache else None
+        if responses is None:
+            print_login_error(e)
+            sys.exit(1)
+        return responses, True
 
+    stale = False
+    try:
+        with timings.phase("fetch"):
+            responses = client.fetch(queries)
+    except PiHoleError as e:
+        responses = get_last_responses(host, queries, e) if cache else None
+        if responses is None:
+            print(f"Failed to fetch data from Pi-hole: {e}")
+            sys.exit(1)
+        stale = True
+        return responses, stale
+    finally:
+        # The output shown instead of the error shouldn't mention the logout failing as well
+        disconnect(args, client, quiet=stale)
 
-def time_ago(unix_timestamp: int) -> dict:
-    now = datetime.now(timezone.utc)
-    past_time = datetime.fromtimestamp(unix_timestamp, timezone.utc)
+    if cache:
+        get_cache(host).update(responses)
+    return responses, False
 
-    delta = now - past_time
 
-    days = delta.days
-    hours, remainder = divmod(delta.seconds, 3600)
-    minutes, _ = divmod(remainder, 60)
+def get_last_responses(
+    host: Host, queries: tuple, error: "PiHoleError"
+) -> Optional[dict]:
+    """
+    Get the cached responses to show instead of failing, however old they are.
 
-    return {
-        "gravity.relative.days": days,
-        "gravity.relative.hours": hours,
-        "gravity.relative.minutes": minutes,
-    }
+    Returns None if the Pi-hole did respond, e.g. rejected the password, or not all the responses are cached.
+    """
+    if error.code is not None and error.code < 500:
+        return None
+    responses, _ = get_cache(host).lookup(queries, stale=True)
+    return responses if len(responses) == len(queries) else None
 
 
-DEFAULT_CONTENT = """\
-[cyan2]─────────────────────────────────────────────────────[]
-[white]PiHole[] ([green4]{blocking}[]) [lightgreen]{version.core.local.version}[white], Web [lightgreen]{version.web.local.version}[white], FTL [lightgreen]{version.ftl.local.version}
-[cyan2]─────────────────────────────────────────────────────[]
-Blocking [darkcyan]{gravity.domains_being_blocked}[] domains for [steelblue]{clients.active}[] clients
-Blocked [fuchsia]{queries.blocked}[] out of [lightgreen]{queries.total}[] queries [underline]today[] ([steelblue]{queries.percent_blocked}%[])
-[grey37]Gravity last updated [bold grey50]{gravity.relative.days}[grey37] days [bold grey50]{gravity.relative.hours}[grey37] hours and [bold grey50]{gravity.relative.minutes}[grey37] minutes ago\
-"""
+def watch(
+    args,
+    targets: list,
+    hosts: list,
+    queries: dict,
+    timings: Timings,
+    deadline: Deadline,
+    names: tuple = (),
+    history: Optional["History"] = None,
+):
+    """
+    Update the outputs every few seconds, using one session per Pi-hole for the whole run.
 
+    Outputs to stdout are updated in place, files are replaced whenever their content changes.
+    The timings are those of the last update, and the deadline is the budget of every update.
+    Every update adds a sample of the counters of the variable names to the history, if any.
+    """
+    from pihello.client import PiHoleError
+    from pihello.screen import Screen
 
-def main():
-    args = get_args()
-    pihole = "{}://{}".format(args.proto, args.addr)
+    hosts = [host for host in hosts if queries[host.name]]
+    clients = for_hosts(lambda host: connect(args, host, timings, deadline), hosts)
+    responses = {name: {} for name in queries}
+    variables = None
+    to_stdout = any(output.dest == "-" for output, _, _ in targets)
+    try:
+        with Screen() if to_stdout else nullcontext() as screen:
+            while True:
+                started = time.monotonic()
+                deadline.restart()
+                try:
+                    with timings.phase("fetch"):
+                        responses.update(
+                            for_hosts(
+                                lambda host: clients[host.name].fetch(
+                                    queries[host.name]
+                                ),
+                                hosts,
+                            )
+                        )
+                    with timings.phase("variables"):
+                        variables = get_all_variables(responses)
+                    stale = False
+                except PiHoleError:
+                    # Keep showing the last values until the Pi-hole responds again
+                    stale = True
+                shown = variables
+                if variables is not None and history is not None:
+                    shown = history.update(variables, names, record=not stale)
+                if shown is not None:
+                    text = ""
+                    for output, console, template in targets:
+                        rendered = render_output(
+                            args, output, console, template, shown, timings, stale
+                        )
+                        if output.dest == "-":
+                            text += rendered
+                            continue
+                        try:
+                            write_file(output.dest, rendered)
+                        except OSError:
+                            pass  # Try again with the next update
+                    if to_stdout:
+                        screen.update(text)
+                time.sleep(max(0, args.watch - (time.monotonic() - started)))
+                timings.clear()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if history is not None:
+            history.close()
+        for client in clients.values():
+            disconnect(args, client)
 
-    ctx = ssl.create_default_context()
-    if args.insecure:
-        ctx.check_hostname = False
-        ctx.verify_mode = ssl.CERT_NONE
 
-    sid = auth(pihole, args.password, ctx)
-    if not sid:
-        sys.exit(1)
+def revalidate(args, hosts: list, queries: dict):
+    """Refresh the expired cached responses in a background process, so the caller doesn't wait for it."""
+    sys.stdout.flush()
+    pid = os.fork() if hasattr(os, "fork") else -1
+    if pid > 0:
+        return
 
+    if pid == 0:
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in range(3):
+            os.dup2(devnull, fd)
     try:
-        versions = flatten_dict(get_data(pihole, sid, ctx, query="info/version"))
-        blocking = flatten_dict(get_data(pihole, sid, ctx, query="dns/blocking"))
-        summary = flatten_dict(get_data(pihole, sid, ctx, query="stats/summary"))
-        blocked = get_data(pihole, sid, ctx, query="stats/recent_blocked")["blocked"]
-        recent_blocked = {"recent_blocked": blocked[0] if blocked else ""}
-    except (error.HTTPError, error.URLError) as e:
-        print(f"Failed to fetch data from Pi-hole: {e}")
-        sys.exit(1)
+        for_hosts(lambda host: fetch(args, host, queries[host.name], cache=True), hosts)
+    except (SystemExit, OSError):
+        pass
     finally:
-        logout(pihole, sid, ctx)
+        if pid == 0:
+            os._exit(0)
 
-    console = Console(
-        args.width,
-        args.height,
-        tab_size=args.indent,
-        variables={
-            **versions,
-            **summary,
-            **blocking,
-            **recent_blocked,
-            **time_ago(summary["gravity.last_update"]),
-        },
-    )
-    if args.timestamp:
-        ts = (
-            datetime.now()
-            if isinstance(args.timestamp, bool)
-            else datetime.now().strftime(args.timestamp)
+
+def serve(args, hosts: list, deadline: Deadline):
+    """Render for --client on a Unix socket, sharing one session per Pi-hole and coalescing their fetches."""
+    import signal
+    from functools import lru_cache
+    from types import SimpleNamespace
+    from pihello.console import Console
+    from pihello.server import Fetcher, RenderServer, ServerError, default_socket_path
+    from pihello.template import Template
+
+    multiple = hosts[0].name != ""
+    default_content = get_hosts_content(hosts) if multiple else DEFAULT_CONTENT
+    compile_template = lru_cache(maxsize=64)(Template.compile)
+    # Shared by all the requests, so the rates cover the renders of every client
+    history = get_history(args, hosts)
+
+    def render_request(request: dict) -> str:
+        timings = Timings()
+        color_system = ColorSystem(request.get("colors", ColorSystem.TRUECOLOR))
+        content = request.get("template")
+        template = compile_template(content or default_content, color_system)
+        if multiple:
+            queries = get_host_endpoints(template.variables, hosts)
+        else:
+            queries = {"": get_endpoints(template.variables)}
+
+        responses, stale = fetcher.get(queries)
+        console = Console(
+            request.get("width", 80),
+            request.get("height", 25),
+            tab_size=request.get("indent", 4),
+            clip=bool(request.get("clip")),
+            color_system=color_system,
+            variables=history.update(
+                get_all_variables(responses), template.variables, record=not stale
+            ),
         )
-        console.print(ts)
+        add_run_variables(console, template, timings, stale)
+        options = SimpleNamespace(timestamp=request.get("timestamp", False))
+        return render(options, console, template, "\n" if content is None else "")
 
+    try:
+        path = args.socket or default_socket_path()
+    except (ServerError, OSError) as e:
+        print(f"Could not create the socket, give one with --socket: {e}")
+        sys.exit(1)
+    try:
+        # An explicit socket is meant to be shared, e.g. with everyone logging in to a jump host
+        server = RenderServer(path, render_request, shared=args.socket is not None)
+    except (ServerError, OSError) as e:
+        print(f"Could not listen on {path}: {e}")
+        sys.exit(1)
+
+    # Stop as cleanly on SIGTERM as on Ctrl+C
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    clients = {}
+    try:
+        clients = for_hosts(lambda host: connect(args, host, deadline=deadline), hosts)
+        fetcher = Fetcher(clients, deadline=deadline)
+        print(f"Listening on {path}", file=sys.stderr)
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        history.close()
+        for client in clients.values():
+            disconnect(args, client)
+
+
+def render_remote(args, deadline: Deadline) -> Optional[str]:
+    """
+    Let the --serve daemon render the output.
+
+    Returns None if no daemon is running but a Pi-hole to query directly was given. Exits on failure.
+    """
+    from pihello.server import ServerError, default_socket_path, request_render
+
+    content = None
     if args.file:
         with open(args.file) as f:
             content = f.read()
-            console.print(content, end="")
-    else:
-        console.print(DEFAULT_CONTENT)
+    request = {
+        "template": content,
+        "width": args.width,
+        "height": args.height,
+        "clip": args.clip,
+        "indent": args.indent,
+        "colors": get_color_system(args).value,
+        "timestamp": args.timestamp,
+    }
+
+    try:
+        path = args.socket or default_socket_path()
+    except (ServerError, OSError) as e:
+        if args.addr or args.hosts:
+            return None
+        print(f"No pihello daemon can be reached, give its socket with --socket: {e}")
+        sys.exit(1)
+    try:
+        return request_render(path, request, timeout=deadline.cap(30))
+    except ServerError as e:
+        print(f"Failed to render: {e}")
+    except OSError as e:
+        if args.addr or args.hosts:
+            return None
+        print(f"No pihello daemon is running on {path}: {e}")
+    sys.exit(1)
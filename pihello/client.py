@@ -0,0 +1,295 @@
+import json
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from http import client as http
+from typing import ContextManager, Optional, Union
+from .cache import SessionCache
+from .timing import Deadline, Timings
+
+# Seconds logging out may take with a deadline, on top of it
+LOGOUT_TIMEOUT = 1.0
+
+
+class PiHoleError(Exception):
+    """Raised when a request to the Pi-hole API failed."""
+
+    def __init__(self, message: str, code: Optional[int] = None, details: str = ""):
+        super().__init__(message)
+        """HTTP status code, if the Pi-hole responded at all."""
+        self.code = code
+        """Body of the error response."""
+        self.details = details
+
+
+class _HTTPSConnection(http.HTTPSConnection):
+    """HTTPS connection which resumes the TLS session of the client it belongs to."""
+
+    def __init__(self, host: str, client: "PiHoleClient", **kwargs):
+        super().__init__(host, **kwargs)
+        self.client = client
+
+    def connect(self):
+        with self.client._phase("connect"):
+            http.HTTPConnection.connect(self)
+        with self.client._phase("tls"):
+            self.sock = self._context.wrap_socket(
+                self.sock, server_hostname=self.host, session=self.client.tls_session
+            )
+
+
+class PiHoleClient:
+    """
+    Client for the Pi-hole v6 API.
+
+    Keeps a pool of keep-alive connections to the Pi-hole and resumes the TLS session
+    for every new connection, so a run pays for at most one full TLS handshake.
+    If a SessionCache is given, the API session is reused across runs and only
+    re-authenticated once the Pi-hole rejects it. If Timings are given, connecting,
+    the TLS handshake, authenticating, every endpoint and logging out are timed.
+
+    Connecting and every read of the socket give up after the timeout, shortened to what
+    is left of the deadline. GET requests, which are idempotent, are retried with an
+    exponential backoff when the Pi-hole couldn't be reached or failed with a server error,
+    as long as the deadline leaves time for it.
+    """
+
+    def __init__(
+        self,
+        addr: str,
+        password: str,
+        proto: str = "http",
+        insecure: bool = False,
+        sessions: Optional[SessionCache] = None,
+        timings: Optional[Timings] = None,
+        timeout: Optional[float] = None,
+        retries: int = 0,
+        deadline: Optional[Deadline] = None,
+    ):
+        self.addr = addr
+        self.password = password
+        self.proto = proto
+        self.sessions = sessions
+        self.timings = timings
+        """Seconds to wait for connecting and for every read, None to wait forever."""
+        self.timeout = timeout
+        """How many times a failed GET request is tried again."""
+        self.retries = retries
+        """Seconds to wait before the first retry, doubled for every further one."""
+        self.backoff = 0.1
+        """Budget of all the requests, none by default."""
+        self.deadline = deadline or Deadline()
+        """Session id of the authenticated session."""
+        self.sid = ""
+        """Seconds the session stays valid after its last use."""
+        self.validity = 0
+        self._last_used = 0.0
+        """TLS session which new connections try to resume."""
+        self.tls_session = None
+
+        self.ctx = None
+        if proto == "https":
+            self.ctx = ssl.create_default_context()
+            if insecure:
+                self.ctx.check_hostname = False
+                self.ctx.verify_mode = ssl.CERT_NONE
+
+        self._pool = []
+        self._lock = threading.Lock()
+        self._auth_lock = threading.Lock()
+
+    def __enter__(self) -> "PiHoleClient":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def url(self) -> str:
+        """Get the base URL of the Pi-hole."""
+        return f"{self.proto}://{self.addr}"
+
+    def _phase(self, name: str) -> ContextManager:
+        """Time a phase of talking to the Pi-hole, if timings are collected."""
+        return nullcontext() if self.timings is None else self.timings.phase(name)
+
+    def _connect(self, timeout: Optional[float]) -> http.HTTPConnection:
+        """Open a new connection to the Pi-hole."""
+        if self.ctx is None:
+            conn = http.HTTPConnection(self.addr, timeout=timeout)
+            with self._phase("connect"):
+                conn.connect()
+        else:
+            # Times connecting and the TLS handshake on its own
+            conn = _HTTPSConnection(self.addr, self, context=self.ctx, timeout=timeout)
+            conn.connect()
+        return conn
+
+    def _acquire(self, timeout: Optional[float]) -> tuple:
+        """Get an idle connection from the pool or open a new one. Returns (connection, reused)."""
+        with self._lock:
+            conn = self._pool.pop() if self._pool else None
+        if conn is None:
+            return self._connect(timeout), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def _release(self, conn: http.HTTPConnection):
+        """Return a connection to the pool and remember its TLS session."""
+        if isinstance(conn.sock, ssl.SSLSocket):
+            self.tls_session = conn.sock.session
+        with self._lock:
+            self._pool.append(conn)
+
+    def close(self):
+        """Close all the pooled connections and store the session, if sessions are cached."""
+        with self._lock:
+            pool, self._pool = self._pool, []
+        for conn in pool:
+            conn.close()
+
+        if self.sessions is not None and self.sid and self._last_used:
+            try:
+                self.sessions.set(self.url, self.sid, self.validity, self._last_used)
+            except OSError:
+                pass  # The session is only reused, e.g. the home may be read-only
+
+    def request(
+        self,
+        method: str,
+        query: str,
+        data: Optional[dict] = None,
+        retry: bool = True,
+        timeout: Optional[float] = None,
+    ) -> tuple:
+        """
+        Send a request to the API endpoint and return the response as (status, body).
+
+        A request rejected with HTTP 401 is retried once with a new session. It gives up after
+        the timeout, if given, instead of the client's timeout shortened to the deadline.
+        """
+        if timeout is None:
+            timeout = self.deadline.cap(self.timeout)
+        if timeout == 0:
+            raise PiHoleError(f"{self.url}/api/{query}: deadline exceeded")
+
+        sid = self.sid
+        headers = {"sid": sid} if sid else {}
+        body = None
+        if data is not None:
+            body = json.dumps(data).encode("utf-8")
+            headers["Content-Type"] = "application/json; charset=utf-8"
+
+        conn = None
+        try:
+            conn, reused = self._acquire(timeout)
+            try:
+                conn.request(method, f"/api/{query}", body=body, headers=headers)
+                res = conn.getresponse()
+            except (http.RemoteDisconnected, ConnectionError):
+                if not reused:
+                    raise
+                # The Pi-hole closed the idle keep-alive connection, try a fresh one
+                conn.close()
+                conn = self._connect(timeout)
+                conn.request(method, f"/api/{query}", body=body, headers=headers)
+                res = conn.getresponse()
+            raw = res.read()
+        except (OSError, http.HTTPException) as e:
+            if conn is not None:
+                conn.close()
+            raise PiHoleError(f"{self.url}/api/{query}: {e}") from e
+
+        if res.will_close:
+            conn.close()
+        else:
+            self._release(conn)
+
+        if res.status == 401 and retry and query != "auth":
+            self._reauth(sid)
+            return self.request(method, query, data=data, retry=False)
+
+        if res.status >= 400:
+            raise PiHoleError(
+                f"HTTP Error {res.status}: {res.reason}",
+                code=res.status,
+                details=raw.decode("utf-8", "replace"),
+            )
+        if sid:
+            self._last_used = time.time()
+        return res.status, raw
+
+    def get(self, query: str) -> Union[dict, str]:
+        """Get the data of an API endpoint. Returns the raw text if it's not JSON."""
+        with self._phase(f"get.{query}"):
+            attempt = 0
+            while True:
+                try:
+                    _, raw = self.request("GET", query)
+                    break
+                except PiHoleError as e:
+                    # Client errors such as a rejected session won't go away by trying again
+                    if attempt >= self.retries or (e.code is not None and e.code < 500):
+                        raise
+                    delay = self.backoff * 2**attempt
+                    remaining = self.deadline.remaining()
+                    if remaining is not None and remaining <= delay:
+                        raise
+                time.sleep(delay)
+                attempt += 1
+        try:
+            return json.loads(raw)
+        except json.decoder.JSONDecodeError:
+            return raw.decode("utf-8")
+
+    def fetch(self, queries: tuple) -> dict:
+        """Get the data of the given API endpoints concurrently and return it keyed by query."""
+        with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+            return dict(zip(queries, pool.map(self.get, queries)))
+
+    def auth(self) -> str:
+        """Authenticate with the password and return the session id."""
+        self.sid = ""
+        with self._phase("auth"):
+            _, raw = self.request("POST", "auth", data={"password": self.password})
+        session = json.loads(raw.decode("utf-8")).get("session", {})
+        self.sid = session.get("sid") or ""
+        self.validity = session.get("validity", 0)
+        self._last_used = time.time()
+        return self.sid
+
+    def _reauth(self, stale_sid: str):
+        """Authenticate again, unless another thread already replaced the stale session."""
+        with self._auth_lock:
+            if self.sid == stale_sid:
+                self.auth()
+
+    def login(self) -> str:
+        """Reuse the cached session of the Pi-hole or authenticate a new one. Returns the session id."""
+        if self.sessions is not None:
+            session = self.sessions.get(self.url)
+            if session:
+                self.sid = session["sid"]
+                self.validity = session.get("validity", 0)
+                return self.sid
+        return self.auth()
+
+    def logout(self) -> bool:
+        """End the authenticated session."""
+        # Not part of the deadline, which fetching may have used up, so the session is still
+        # ended and doesn't take up one of the Pi-hole's limited slots until it expires
+        timeout = None if self.deadline.remaining() is None else LOGOUT_TIMEOUT
+        with self._phase("logout"):
+            status, _ = self.request("DELETE", "auth", retry=False, timeout=timeout)
+        self.sid = ""
+        if self.sessions is not None:
+            try:
+                self.sessions.delete(self.url)
+            except OSError:
+                pass
+        # HTTP 204 (No Content) is a successful logout
+        return status == 204
@@ -1,11 +1,130 @@
+import os
 import re
-from colorsys import rgb_to_hls
+from functools import lru_cache
 from enum import IntEnum
 from typing import Optional, Tuple
-from .color_tables import COLOR_NAMES, EIGHT_BIT_PALETTE
 
 RE_COLOR = re.compile(r"^\#([0-9a-f]{6})$|color\(([0-9]{1,3})\)$|rgb\(([\d\s,]+)\)$")
 
+# Levels of the 6x6x6 color cube (16-231) and of the grayscale ramp (232-255)
+CUBE_LEVELS = (0, 95, 135, 175, 215, 255)
+GRAY_LEVELS = tuple(8 + 10 * i for i in range(24))
+
+
+class ColorSystem(IntEnum):
+    """The colors a terminal is able to display."""
+
+    NONE = 0
+    STANDARD = 1
+    EIGHT_BIT = 2
+    TRUECOLOR = 3
+
+    @classmethod
+    def parse(cls, name: str) -> "ColorSystem":
+        """Get the color system from its command line name: none, 16, 256 or truecolor."""
+        return COLOR_SYSTEM_NAMES[name]
+
+    @classmethod
+    def detect(cls, environ=os.environ) -> "ColorSystem":
+        """Guess the color system of the terminal from the environment."""
+        term = environ.get("TERM", "")
+        if environ.get("NO_COLOR") or term == "dumb":
+            return cls.NONE
+        if environ.get("COLORTERM", "").lower() in ("truecolor", "24bit"):
+            return cls.TRUECOLOR
+        if "256color" in term:
+            return cls.EIGHT_BIT
+        if term:
+            return cls.STANDARD
+        # Not a terminal (e.g. cron writing a MOTD), leave the colors as they are
+        return cls.TRUECOLOR
+
+
+COLOR_SYSTEM_NAMES = {
+    "none": ColorSystem.NONE,
+    "16": ColorSystem.STANDARD,
+    "256": ColorSystem.EIGHT_BIT,
+    "truecolor": ColorSystem.TRUECOLOR,
+}
+
+
+@lru_cache(maxsize=None)
+def _ansi_code_tables() -> tuple:
+    """
+    Build the ANSI codes of every 8-bit color number, once, on first use.
+
+    Returns (foreground codes, background codes, underline codes) by color number.
+    """
+    return (
+        tuple(
+            (
+                (str(30 + n),)
+                if n < 8
+                else (str(82 + n),) if n < 16 else ("38", "5", str(n))
+            )
+            for n in range(256)
+        ),
+        tuple(
+            (
+                (str(40 + n),)
+                if n < 8
+                else (str(92 + n),) if n < 16 else ("48", "5", str(n))
+            )
+            for n in range(256)
+        ),
+        tuple(("58", "5", str(n)) for n in range(256)),
+    )
+
+
+def _nearest(levels: tuple) -> tuple:
+    """Build a lookup table of the index of the nearest level for every channel value 0-255."""
+    return tuple(
+        min(range(len(levels)), key=lambda i: abs(levels[i] - value))
+        for value in range(256)
+    )
+
+
+def _distance(a: tuple, b: tuple) -> int:
+    return (a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2 + (a[2] - b[2]) ** 2
+
+
+@lru_cache(maxsize=None)
+def _downsampling_tables() -> tuple:
+    """
+    Build the lookup tables used for downsampling, once, on first use.
+
+    Returns (nearest cube level by channel value, nearest gray level by channel value,
+    nearest standard color by 8-bit color number).
+    """
+    from .color_tables import EIGHT_BIT_PALETTE
+
+    standard = EIGHT_BIT_PALETTE[:16]
+    to_standard = tuple(
+        (
+            n
+            if n < 16
+            else min(
+                range(16), key=lambda i: _distance(standard[i], EIGHT_BIT_PALETTE[n])
+            )
+        )
+        for n in range(256)
+    )
+    return _nearest(CUBE_LEVELS), _nearest(GRAY_LEVELS), to_standard
+
+
+def triplet_to_eight_bit(triplet: Tuple[int, int, int]) -> int:
+    """Get the number of the 8-bit color nearest to the triplet, in constant time."""
+    cube_index, gray_index, _ = _downsampling_tables()
+    red, green, blue = triplet
+    r, g, b = cube_index[red], cube_index[green], cube_index[blue]
+    cube = (CUBE_LEVELS[r], CUBE_LEVELS[g], CUBE_LEVELS[b])
+
+    gray = gray_index[(red + green + blue) // 3]
+    level = GRAY_LEVELS[gray]
+    if _distance((level, level, level), triplet) < _distance(cube, triplet):
+        return 232 + gray
+    return 16 + 36 * r + 6 * g + b
+
 
 class ColorParseError(Exception):
     """Raised when a color could not be parsed."""
@@ -40,29 +159,50 @@ class Color:
     def get_truecolor(self) -> Optional[Tuple[int, int, int]]:
         """Get an equivalent color triplet (R, G, B) for this color."""
         if self.number is not None:
+            from .color_tables import EIGHT_BIT_PALETTE
+
             return EIGHT_BIT_PALETTE[self.number]
         if self.triplet:
             return self.triplet
         return None
 
+    def downgrade(self, system: ColorSystem) -> "Color":
+        """Get the nearest color the given color system is able to display."""
+        if self.is_default or system >= ColorSystem.TRUECOLOR:
+            return self
+
+        number = self.number
+        if number is None:
+            number = triplet_to_eight_bit(self.triplet)
+        if system == ColorSystem.STANDARD:
+            number = _downsampling_tables()[2][number]
+
+        if number == self.number:
+            return self
+        return Color(self.name, number=number)
+
     def get_ansi_codes(self, foreground: bool = True, underline: bool = False) -> tuple:
         """Get the ANSI escape codes for this color."""
         if self.is_default:
             return ("39" if foreground else "59" if underline else "49",)
 
-        elif self.number < 16 and not underline:
-            fore, back = (30, 40) if self.number < 8 else (82, 92)
-            return (str(fore + self.number if foreground else back + self.number),)
-
-        elif self.number is not None:
-            return (
-                "38" if foreground else "58" if underline else "48",
-                "5",
-                str(self.number),
+        if self.number is not None:
+            foreground_codes, background_codes, underline_codes = _ansi_code_tables()
+            table = (
+                foreground_codes
+                if foreground
+                else underline_codes if underline else background_codes
             )
+            return table[self.number]
 
         red, green, blue = self.triplet
-        return ("38" if foreground else "48", "2", str(red), str(green), str(blue))
+        return (
+            "38" if foreground else "58" if underline else "48",
+            "2",
+            str(red),
+            str(green),
+            str(blue),
+        )
 
     @classmethod
     def default(cls) -> "Color":
@@ -79,8 +219,13 @@ class Color:
         return cls(name=str(triplet), triplet=triplet)
 
     @classmethod
+    @lru_cache(maxsize=256)
     def parse(cls, color: str) -> "Color":
-        """Parse a color from string. Can take a rgb(r,g,b), color(n), hex code or color name."""
+        """
+        Parse a color from string. Can take a rgb(r,g,b), color(n), hex code or color name.
+
+        Results are memoized, so the returned instance must not be modified.
+        """
 
         # Check if default color
         color = color.lower().strip()
@@ -88,7 +233,9 @@ class Color:
             return cls(name=color)
 
         # Check if named color
-        color_num = COLOR_NAMES[color]
+        from .color_tables import COLOR_NAMES
+
+        color_num = COLOR_NAMES.get(color)
         if color_num is not None:
             return cls(name=color, number=color_num)
 
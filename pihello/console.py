@@ -1,18 +1,28 @@
-from .style import Style
-
-
-class TagParseError(Exception):
-    """Raised when a tag could not be parsed."""
+from typing import Iterable, Iterator, Mapping
+from .color import ColorSystem
+from .layout import layout
+from .template import Template, TagParseError
+from .variables import Variables
 
 
 class Console:
     """Definition of the console being used."""
 
-    def __init__(self, width=0, height=0, tab_size=4, variables={}):
+    def __init__(
+        self,
+        width=0,
+        height=0,
+        tab_size=4,
+        variables={},
+        clip=False,
+        color_system=ColorSystem.TRUECOLOR,
+    ):
         self.width = width
         self.height = height
         self.tab_size = tab_size
         self.variables = variables
+        self.clip = clip
+        self.color_system = color_system
 
     @property
     def size(self):
@@ -21,56 +31,52 @@ class Console:
 
     def print(self, *objects: tuple, sep=" ", end="\n", style=None):
         """Prints the given styled strings and other positional arguments to stdout."""
-        if not objects:
-            print(sep=sep, end=end)
-
-        strs = [self.style(obj) for obj in objects]
-        print(*strs, sep=sep, end=end)
+        print(self.render(*objects, sep=sep, end=end), end="")
+
+    def render(self, *objects: tuple, sep=" ", end="\n") -> str:
+        """Renders the given styled strings and other positional arguments the way they would be printed."""
+        text = sep.join(self.style(obj) for obj in objects) + end
+        return layout(text, self.width, self.height, self.clip, self.tab_size)
+
+    def render_many(
+        self, *objects: tuple, rows: Iterable[Mapping], sep=" ", end="\n"
+    ) -> Iterator[str]:
+        """
+        Renders the given styled strings and other positional arguments once for every row of variables.
+
+        Strings are compiled only once for all the rows. The variables of a row are looked up
+        before the console's own, which are shared by all the rows.
+        """
+        objects = [
+            self.compile(obj) if isinstance(obj, str) else obj for obj in objects
+        ]
+        for row in rows:
+            variables = Variables(row, self.variables)
+            text = (
+                sep.join(
+                    (
+                        obj.render(variables, self.width)
+                        if isinstance(obj, Template)
+                        else str(obj)
+                    )
+                    for obj in objects
+                )
+                + end
+            )
+            yield layout(text, self.width, self.height, self.clip, self.tab_size)
 
     def style(self, obj) -> str:
         """Wrapper function to determine whether an object has styling and process it accordingly."""
         if isinstance(obj, str):
             return self.parse(obj)
+        if isinstance(obj, Template):
+            return obj.render(self.variables, self.width)
         return str(obj)
 
+    def compile(self, s: str) -> Template:
+        """Compiles a string containing possible styles and variable injections into a reusable Template."""
+        return Template.compile(s, self.color_system)
+
     def parse(self, s: str) -> str:
         """Parses a string containing possible styles and variable injections and returns the styled string."""
-        ptr = 0
-        stop = len(s)
-        buffer = ""
-        while ptr < stop:
-            _next = ""
-            if s[ptr] == "\\" and (s[ptr + 1] == "[" or s[ptr + 1] == "{"):
-                ptr += 1
-                _next = s[ptr]
-
-            elif s[ptr] == "[":  # Beginning of a style
-                end = s.find("]", ptr + 1)
-                if end < 0:
-                    raise TagParseError("Matching ']' could not be found.")
-
-                _next = Style(s[ptr : end + 1]).get_ansi_style()
-                ptr = end
-
-            elif s[ptr] == "{":  # Beginning of a variable
-                end = s.find("}", ptr + 1)
-                if end < 0:
-                    raise TagParseError("Matching '}' could not be found.")
-                var_name = s[ptr : end + 1].strip("{ }")
-                val = self.variables.get(var_name)
-
-                if val is None:
-                    raise TagParseError(f"No variable '{var_name}'.")
-
-                # Shorten floats to 1 decimal place
-                _next = f"{val:.1f}" if isinstance(val, float) else str(val)
-                ptr = end
-
-            else:
-                _next = s[ptr]
-
-            buffer += _next
-            ptr += 1
-
-        buffer += "\x1b[0m"
-        return buffer
+        return self.compile(s).render(self.variables, self.width)
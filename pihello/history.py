@@ -0,0 +1,184 @@
+import mmap
+import os
+import re
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Mapping, Optional, Tuple
+from .variables import DERIVED, Variables, get_counters
+
+RE_UNSAFE = re.compile(r"[^\w.]")
+
+# Enough for 5 minutes of updates every second
+CAPACITY = 512
+# Samples taken closer together than this many seconds are dropped, so frequent renders
+# of the same responses don't push the older samples out of the buffer
+MIN_INTERVAL = 1.0
+
+
+class Samples:
+    """
+    Ring buffer of the last (time, value) samples of a counter.
+
+    The samples are kept as doubles in an array or, with a path, in a memory-mapped file,
+    so they outlive the run. The first two slots are the index of the next sample and
+    the number of samples, followed by the pairs of time and value.
+    """
+
+    def __init__(self, capacity: int = CAPACITY, path: Optional[Path] = None):
+        self.capacity = capacity
+        self._mmap = None
+        size = 2 + 2 * capacity
+        if path is None:
+            self._data = array("d", [0.0]) * size
+        else:
+            self._data = self._map(path, size)
+            head, count = self._data[0], self._data[1]
+            valid = head.is_integer() and count.is_integer()
+            if not (valid and 0 <= head < capacity and 0 <= count <= capacity):
+                self._data[0] = self._data[1] = 0.0  # Not written by this version
+
+    def _map(self, path: Path, size: int) -> memoryview:
+        """Map the file of the samples into memory, creating it or starting it over if it has the wrong size."""
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size != size * 8:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size * 8)
+            self._mmap = mmap.mmap(fd, size * 8)
+        finally:
+            os.close(fd)
+        return memoryview(self._mmap).cast("d")
+
+    def close(self):
+        """Unmap the file of the samples, if any."""
+        if self._mmap is not None:
+            self._data.release()
+            self._mmap.close()
+            self._mmap = None
+
+    def __len__(self) -> int:
+        return int(self._data[1])
+
+    def get(self, age: int) -> Tuple[float, float]:
+        """Get a sample as (time, value) by its age, 0 being the newest."""
+        i = 2 + 2 * ((int(self._data[0]) - 1 - age) % self.capacity)
+        return self._data[i], self._data[i + 1]
+
+    def add(self, t: float, value: float):
+        """
+        Add a sample, replacing the oldest one once the buffer is full.
+
+        A value lower than the last one means the counter was reset, e.g. at midnight,
+        so the samples before it are dropped.
+        """
+        count = len(self)
+        if count:
+            last_t, last_value = self.get(0)
+            if 0 <= t - last_t < MIN_INTERVAL:
+                return
+            if t < last_t or value < last_value:
+                count = 0
+
+        head = int(self._data[0])
+        self._data[2 + 2 * head] = t
+        self._data[3 + 2 * head] = value
+        self._data[0] = (head + 1) % self.capacity
+        self._data[1] = min(count + 1, self.capacity)
+
+    def delta(self):
+        """Get the change since the previous sample, 0 without one."""
+        if len(self) < 2:
+            return 0
+        delta = self.get(0)[1] - self.get(1)[1]
+        return int(delta) if delta.is_integer() else delta
+
+    def rate(self, seconds: float) -> float:
+        """
+        Get the average change per minute over the last seconds, 0.0 without a previous sample.
+
+        It's measured from the newest sample which is at least that old, or from the oldest
+        sample if none is, e.g. while the history is still shorter than that.
+        """
+        count = len(self)
+        if count < 2:
+            return 0.0
+        newest_t, newest_value = self.get(0)
+        for age in range(1, count):
+            t, value = self.get(age)
+            if newest_t - t >= seconds:
+                break
+        if newest_t <= t:
+            return 0.0
+        return (newest_value - value) / (newest_t - t) * 60
+
+
+class History:
+    """
+    Samples of the counters behind derived variables such as `queries.total.rate_1m`,
+    `queries.blocked.rate_5m` and `queries.total.delta`, taken whenever the variables are updated.
+
+    The samples are kept in memory, e.g. for the updates of watch mode, or with a directory,
+    in a memory-mapped file per counter there, so consecutive runs add to the same history.
+    Updates may come from several threads.
+    """
+
+    def __init__(self, directory: Optional[Path] = None, capacity: int = CAPACITY):
+        self.directory = directory
+        self.capacity = capacity
+        """Samples by the name of their counter."""
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def _get_samples(self, counter: str) -> Samples:
+        samples = self.samples.get(counter)
+        if samples is None:
+            path = None
+            if self.directory is not None:
+                path = self.directory / f"{RE_UNSAFE.sub('_', counter)}.samples"
+            try:
+                if path is not None:
+                    self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+                samples = Samples(self.capacity, path)
+            except OSError:
+                # The history is only an optimization, e.g. the home may be read-only
+                samples = Samples(self.capacity)
+            self.samples[counter] = samples
+        return samples
+
+    def update(
+        self,
+        variables: Mapping,
+        names: tuple,
+        now: Optional[float] = None,
+        record: bool = True,
+    ) -> Mapping:
+        """
+        Add a sample of every counter which the given variable names derive from and get the variables with the derived ones.
+
+        Without record, e.g. while the values are stale, only the samples taken so far are used.
+        Counters which aren't numbers are left out, so their derived variables stay missing.
+        """
+        now = time.time() if now is None else now
+        derived = {}
+        with self._lock:
+            for counter in get_counters(names):
+                value = variables.get(counter)
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                samples = self._get_samples(counter)
+                if record:
+                    samples.add(now, value)
+                for suffix, seconds in DERIVED.items():
+                    derived[f"{counter}.{suffix}"] = (
+                        samples.delta() if seconds is None else samples.rate(seconds)
+                    )
+        return Variables(derived, variables) if derived else variables
+
+    def close(self):
+        """Unmap the files of the samples."""
+        with self._lock:
+            for samples in self.samples.values():
+                samples.close()
+            self.samples = {}
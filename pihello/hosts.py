@@ -0,0 +1,111 @@
+from collections.abc import Mapping
+from typing import Dict, List, NamedTuple, Optional
+from .variables import Variables, get_endpoints, time_ago
+
+# Summary variables which are summed up over all the Pi-holes
+SUMMED = (
+    "queries.total",
+    "queries.blocked",
+    "queries.cached",
+    "queries.forwarded",
+    "queries.unique_domains",
+    "clients.active",
+    "clients.total",
+)
+
+
+class HostsParseError(Exception):
+    """Raised when a hosts file could not be parsed."""
+
+
+class Host(NamedTuple):
+    """Definition of a Pi-hole and how to connect to it."""
+
+    name: str
+    addr: str
+    password: str
+    proto: str = "http"
+    insecure: bool = False
+
+
+def load_hosts(path: str) -> List[Host]:
+    """
+    Load the Pi-holes from an INI file with a section per Pi-hole:
+
+        [site1]
+        addr = pi.hole
+        password = app-password
+        https = yes
+        insecure = no
+    """
+    from configparser import ConfigParser
+
+    parser = ConfigParser(interpolation=None)
+    with open(path) as f:
+        parser.read_file(f)
+
+    hosts = []
+    for name in parser.sections():
+        section = parser[name]
+        if "." in name:
+            raise HostsParseError(f"Host name {name!r} must not contain a dot.")
+        if "addr" not in section or "password" not in section:
+            raise HostsParseError(f"Host {name!r} needs an addr and a password.")
+        hosts.append(
+            Host(
+                name=name,
+                addr=section["addr"],
+                password=section["password"],
+                proto="https" if section.getboolean("https", False) else "http",
+                insecure=section.getboolean("insecure", False),
+            )
+        )
+
+    if not hosts:
+        raise HostsParseError(f"No hosts found in {path!r}.")
+    return hosts
+
+
+def get_host_endpoints(names: tuple, hosts: List[Host]) -> Dict[str, tuple]:
+    """Get the API endpoints to fetch from each Pi-hole for the given hosts.* and all.* variables."""
+    wanted = {host.name: [] for host in hosts}
+    for name in names:
+        scope, _, rest = name.partition(".")
+        if scope == "hosts":
+            host, _, rest = rest.partition(".")
+            if host in wanted:
+                wanted[host].append(rest)
+        else:
+            for host_names in wanted.values():
+                host_names.append(rest if scope == "all" else name)
+
+    return {host: get_endpoints(tuple(names)) for host, names in wanted.items()}
+
+
+def aggregate(
+    host_variables: Dict[str, Mapping], now: Optional[float] = None
+) -> Variables:
+    """Combine the variables of each Pi-hole into hosts.<name>.* variables and all.* totals."""
+    totals = {}
+    for key in SUMMED:
+        values = [v[key] for v in host_variables.values() if key in v]
+        if values:
+            totals[f"all.{key}"] = sum(values)
+
+    if totals.get("all.queries.total"):
+        totals["all.queries.percent_blocked"] = (
+            totals.get("all.queries.blocked", 0) / totals["all.queries.total"] * 100
+        )
+
+    # The most recently updated gravity
+    updates = [
+        v["gravity.last_update"]
+        for v in host_variables.values()
+        if "gravity.last_update" in v
+    ]
+    if updates:
+        totals["all.gravity.last_update"] = max(updates)
+        for key, val in time_ago(max(updates), now).items():
+            totals[f"all.{key}"] = val
+
+    return Variables(totals, {"hosts": host_variables})
@@ -0,0 +1,90 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+RE_ESCAPE = re.compile(r"(\x1b\[[0-9;?]*[A-Za-z])")
+
+
+class _ScreenFull(Exception):
+    """Raised when there is no more room for text on the screen."""
+
+
+@lru_cache(maxsize=4096)
+def char_width(char: str) -> int:
+    """Get the number of terminal columns the character takes up."""
+    if unicodedata.combining(char) or unicodedata.category(char) in ("Mn", "Me", "Cf"):
+        return 0
+    if unicodedata.east_asian_width(char) in ("W", "F"):
+        return 2
+    return 1
+
+
+def layout(
+    text: str, width: int = 0, height: int = 0, clip: bool = False, tab_size: int = 4
+) -> str:
+    """
+    Fit styled text to a screen of the given size (0 = no limit), in a single pass.
+
+    Lines longer than the width are wrapped onto the next line or, with clip, cut off.
+    Lines past the height are discarded. Escape sequences are always kept,
+    so the styling stays intact, and tabs are expanded to the tab size.
+    """
+    if not width and not height and "\t" not in text:
+        return text
+
+    lines = []
+    line = []
+    col = 0
+    overflow = False
+
+    def put(chars: str, chars_width: int):
+        nonlocal line, col
+        if width and col + chars_width > width:
+            lines.append("".join(line))
+            line, col = [], 0
+        if height and len(lines) >= height:
+            raise _ScreenFull
+        line.append(chars)
+        col += chars_width
+
+    try:
+        for i, segment in enumerate(RE_ESCAPE.split(text)):
+            if i % 2:  # Escape sequence
+                line.append(segment)
+                continue
+
+            for j, chunk in enumerate(segment.split("\n")):
+                if j:
+                    # Empty lines take up a line of the screen as well
+                    if height and len(lines) >= height:
+                        raise _ScreenFull
+                    lines.append("".join(line))
+                    line, col, overflow = [], 0, False
+                if overflow or not chunk:
+                    continue
+
+                if chunk.isascii() and "\t" not in chunk:
+                    if not width or col + len(chunk) <= width:
+                        put(chunk, len(chunk))
+                        continue
+                    if clip:
+                        put(chunk[: width - col], width - col)
+                        overflow = True
+                        continue
+
+                for char in chunk:
+                    if char == "\t":
+                        char = " " * (tab_size - col % tab_size) if tab_size else ""
+                        char_cols = len(char)
+                    else:
+                        char_cols = char_width(char)
+                    if clip and width and col + char_cols > width:
+                        overflow = True
+                        break
+                    put(char, char_cols)
+
+    except _ScreenFull:
+        return "\n".join(lines) + "\x1b[0m" + ("\n" if text.endswith("\n") else "")
+
+    lines.append("".join(line))
+    return "\n".join(lines)
@@ -0,0 +1,127 @@
+import os
+import stat
+from typing import TYPE_CHECKING, List, Mapping, NamedTuple, Optional
+from .color import COLOR_SYSTEM_NAMES
+
+if TYPE_CHECKING:
+    from .template import Template
+
+
+class OutputParseError(Exception):
+    """Raised when an output could not be parsed."""
+
+
+class Output(NamedTuple):
+    """Definition of a template to render, where to and for which screen."""
+
+    """Path of the template file, empty for the default template."""
+    template: str
+    """Path of the file to write, "-" for stdout."""
+    dest: str = "-"
+    width: int = 80
+    height: int = 25
+    """Name of the color system, None to detect it."""
+    colors: Optional[str] = None
+    clip: bool = False
+    indent: int = 4
+
+
+def parse_output(spec: str, defaults: Output) -> Output:
+    """
+    Parse an output given as TEMPLATE:DEST[:OPTIONS], such as
+
+        motd.txt:/etc/motd:width=60,height=0,colors=none
+
+    Options are comma separated: width=N, height=N, indent=N, colors=NAME and clip.
+    Those left out are taken from the defaults. An empty TEMPLATE is the default template.
+    """
+    template, sep, rest = spec.partition(":")
+    dest, _, options = rest.partition(":")
+    if not sep or not dest:
+        raise OutputParseError(f"Output {spec!r} is not TEMPLATE:DEST[:OPTIONS].")
+
+    fields = defaults._replace(template=template, dest=dest)._asdict()
+    for option in filter(None, options.split(",")):
+        name, sep, value = option.partition("=")
+        if name == "clip" and not sep:
+            fields["clip"] = True
+        elif name in ("width", "height", "indent") and value.isdigit():
+            fields[name] = int(value)
+        elif name == "colors" and value in COLOR_SYSTEM_NAMES:
+            fields["colors"] = value
+        else:
+            raise OutputParseError(f"Invalid option {option!r} of output {spec!r}.")
+    return Output(**fields)
+
+
+def write_file(path: str, text: str) -> bool:
+    """
+    Atomically replace the file with the text, unless it already has exactly that content.
+
+    Returns whether the file was written. Readers see either the old or the new content, never
+    a partial one, and file watchers aren't woken up by unchanged output. A replaced file keeps
+    its permissions, a new one gets the default permissions.
+    """
+    data = text.encode("utf-8")
+    mode = None
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(data) + 1) == data:
+                return False
+            mode = stat.S_IMODE(os.fstat(f.fileno()).st_mode)
+    except FileNotFoundError:
+        pass
+
+    directory, name = os.path.split(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # In the same directory, so it can be renamed over the file
+    tmp = os.path.join(directory, f".{name}.{os.getpid()}.tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        with open(fd, "wb") as f:
+            f.write(data)
+        if mode is not None:
+            os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return True
+
+
+def get_values_digest(output: Output, template: "Template", variables: Mapping) -> str:
+    """
+    Get a digest of what the output shows: its options, its template and the values of the variables it references.
+
+    The _timing.* variables are left out, they differ on every run.
+    """
+    import hashlib
+    import json
+
+    values = [
+        (name, variables.get(name))
+        for name in template.variables
+        if not name.startswith("_timing.")
+    ]
+    data = json.dumps([list(output), template.to_dict(), values], default=str)
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def get_line_digests(text: str) -> List[str]:
+    """Get a digest of every line of the rendered output."""
+    import hashlib
+
+    return [
+        hashlib.blake2b(line.encode("utf-8"), digest_size=8).hexdigest()
+        for line in text.split("\n")
+    ]
+
+
+def get_changed_lines(previous: List[str], current: List[str]) -> List[int]:
+    """Get the numbers of the lines whose digests differ, counting from 1. Lines which are gone count as changed."""
+    return [
+        number
+        for number in range(1, max(len(previous), len(current)) + 1)
+        if previous[number - 1 : number] != current[number - 1 : number]
+    ]
@@ -0,0 +1,60 @@
+import re
+import sys
+from typing import List, TextIO
+from .ansi import DEFAULT, transition
+
+RE_SGR = re.compile(r"\x1b\[([0-9;]*)m")
+
+
+def split_lines(text: str) -> List[str]:
+    """Split styled text into lines which each start with the style they inherit from the previous lines."""
+    lines = []
+    state = DEFAULT
+    for line in text.split("\n"):
+        lines.append(transition(DEFAULT, state) + line)
+        for match in RE_SGR.finditer(line):
+            state = state.apply(match.group(1).split(";"))
+    return lines
+
+
+class Screen:
+    """A terminal screen which is repainted in place, rewriting only the lines that changed."""
+
+    def __init__(self, out: TextIO = sys.stdout):
+        self.out = out
+        """Lines currently shown on the screen."""
+        self.lines = []
+
+    def __enter__(self) -> "Screen":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """Hide the cursor and clear the screen."""
+        self.out.write("\x1b[?25l\x1b[2J\x1b[H")
+        self.out.flush()
+        self.lines = []
+
+    def stop(self):
+        """Move the cursor below the shown lines and show it again."""
+        self.out.write(f"\x1b[0m\x1b[{len(self.lines) + 1};1H\x1b[?25h")
+        self.out.flush()
+
+    def update(self, text: str):
+        """Show the given text, repainting only the lines which differ from the ones shown."""
+        lines = split_lines(text.rstrip("\n"))
+        buffer = []
+        for row, line in enumerate(lines):
+            if row < len(self.lines) and self.lines[row] == line:
+                continue
+            buffer.append(f"\x1b[{row + 1};1H{line}\x1b[0m\x1b[K")
+
+        if len(lines) < len(self.lines):
+            buffer.append(f"\x1b[{len(lines) + 1};1H\x1b[J")
+
+        self.out.write("".join(buffer))
+        self.out.flush()
+        self.lines = lines
@@ -0,0 +1,204 @@
+import json
+import os
+import socket
+import socketserver
+import stat
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+from .timing import Deadline
+
+# Thin clients only need request_render(), so they don't import the API client
+if TYPE_CHECKING:
+    from .client import PiHoleClient
+
+
+class ServerError(Exception):
+    """Raised when the rendering daemon could not be reached or failed to render."""
+
+
+def default_socket_path() -> str:
+    """
+    Get the path of the daemon's Unix socket, in a directory only the current user can access.
+
+    That's $XDG_RUNTIME_DIR if there is one, otherwise a directory of its own in /tmp.
+    Raises ServerError if someone else got to create that directory first.
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "pihello.sock")
+
+    directory = f"/tmp/pihello-{os.getuid()}"
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise ServerError(f"{directory} is not a private directory of the current user")
+    return os.path.join(directory, "pihello.sock")
+
+
+class Fetcher:
+    """
+    Fetches the API responses of the Pi-holes for any number of concurrent renders.
+
+    Responses are kept in memory for as long as they'd be cached on disk. Only one fetch runs at
+    a time, so renders which need a refresh while another one is fetching wait for its
+    responses instead of sending their own requests. The deadline, if any, is the budget
+    of every fetch and is shared with the clients.
+    """
+
+    def __init__(
+        self,
+        clients: Dict[str, "PiHoleClient"],
+        ttls: Optional[dict] = None,
+        deadline: Optional[Deadline] = None,
+    ):
+        from .cache import DEFAULT_TTLS
+
+        """Authenticated API clients by host name."""
+        self.clients = clients
+        """Seconds the responses of each API endpoint stay fresh."""
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+        """Pairs of (fetch time, data) by host name and query."""
+        self.responses = {name: {} for name in clients}
+        self.deadline = deadline or Deadline()
+        self._lock = threading.Lock()
+
+    def get(self, queries: dict) -> tuple:
+        """
+        Get the responses of the given queries by host name, fetching the ones which aren't fresh.
+
+        Returns a tuple of (responses, stale) where stale is set if the Pi-holes couldn't be reached
+        and the last responses are served instead.
+        """
+        from .client import PiHoleError
+
+        with self._lock:
+            now = time.time()
+            missing = {}
+            for name, host_queries in queries.items():
+                stale = tuple(
+                    query
+                    for query in host_queries
+                    if self.responses[name].get(query, (0,))[0]
+                    + self.ttls.get(query, 0)
+                    <= now
+                )
+                if stale:
+                    missing[name] = stale
+
+            stale = False
+            try:
+                self.deadline.restart()
+                self._fetch(missing)
+            except PiHoleError:
+                stale = True
+                # Serve the last responses while the Pi-hole is unreachable, if there are any
+                if any(
+                    query not in self.responses[name]
+                    for name, host_queries in missing.items()
+                    for query in host_queries
+                ):
+                    raise
+
+            responses = {
+                name: {query: self.responses[name][query][1] for query in host_queries}
+                for name, host_queries in queries.items()
+            }
+            return responses, stale
+
+    def _fetch(self, queries: dict):
+        if not queries:
+            return
+        if len(queries) == 1:
+            results = {
+                name: self.clients[name].fetch(host_queries)
+                for name, host_queries in queries.items()
+            }
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+                futures = {
+                    name: pool.submit(self.clients[name].fetch, host_queries)
+                    for name, host_queries in queries.items()
+                }
+                results = {name: future.result() for name, future in futures.items()}
+
+        fetched = time.time()
+        for name, host_responses in results.items():
+            for query, data in host_responses.items():
+                self.responses[name][query] = (fetched, data)
+
+
+class _RenderHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return  # Only checking whether the daemon is running
+        try:
+            reply = {"output": self.server.render(json.loads(line))}
+        except Exception as e:  # Reported to the client, the daemon keeps running
+            reply = {"error": f"{type(e).__name__}: {e}"}
+        try:
+            self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+        except OSError:
+            pass  # The client gave up waiting
+
+
+class RenderServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Daemon which renders for thin clients on a Unix socket.
+
+    Every connection sends one JSON request on a line and gets back {"output": ...} or {"error": ...}.
+    What a request contains is up to the render function. Only the current user may connect,
+    unless the socket is shared, then anyone who can access its directory may.
+    """
+
+    daemon_threads = True
+    # Room for everyone logging in at once
+    request_queue_size = 128
+
+    def __init__(self, path: str, render: Callable[[dict], str], shared: bool = False):
+        self.render = render
+        if os.path.exists(path):
+            try:
+                with socket.socket(socket.AF_UNIX) as sock:
+                    sock.connect(path)
+            except OSError:
+                # Left behind by a daemon which didn't shut down cleanly
+                os.unlink(path)
+            else:
+                raise ServerError(f"Another daemon is already listening on {path}")
+        super().__init__(path, _RenderHandler)
+        os.chmod(path, 0o666 if shared else 0o600)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+def request_render(path: str, request: dict, timeout: Optional[float] = 30) -> str:
+    """
+    Send a render request to the daemon listening on the socket and return its output.
+
+    Raises OSError if no daemon is listening, and ServerError if the daemon failed.
+    """
+    with socket.socket(socket.AF_UNIX) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        try:
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            with sock.makefile("rb") as f:
+                reply = json.loads(f.readline() or b"{}")
+        except (OSError, ValueError) as e:
+            raise ServerError(f"No reply from the daemon on {path}: {e}") from e
+
+    if "output" not in reply:
+        raise ServerError(reply.get("error", "The daemon sent no output."))
+    return reply["output"]
@@ -0,0 +1,42 @@
+import json
+import time
+from typing import Optional
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot could not be loaded."""
+
+
+def save_snapshot(path: str, responses: dict, fetched: Optional[float] = None):
+    """
+    Save the raw API responses of each Pi-hole, keyed by host name and query, to a JSON file.
+
+    The responses of a single Pi-hole (host name "") are stored as
+    {"fetched": ..., "responses": {query: data}}, several Pi-holes as
+    {"fetched": ..., "hosts": {name: {query: data}}}.
+    """
+    snapshot = {"fetched": time.time() if fetched is None else fetched}
+    if set(responses) == {""}:
+        snapshot["responses"] = responses[""]
+    else:
+        snapshot["hosts"] = responses
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, indent=2)
+
+
+def load_snapshot(path: str) -> tuple:
+    """Load a snapshot saved by save_snapshot(). Returns (responses by host name and query, fetch time)."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"Could not load {path!r}: {e}") from e
+
+    if not isinstance(snapshot, dict) or "fetched" not in snapshot:
+        raise SnapshotError(f"{path!r} is not a pihello snapshot.")
+    if "hosts" in snapshot:
+        if not snapshot["hosts"]:
+            raise SnapshotError(f"{path!r} has no hosts.")
+        return snapshot["hosts"], snapshot["fetched"]
+    return {"": snapshot.get("responses", {})}, snapshot["fetched"]
@@ -0,0 +1,44 @@
+from functools import lru_cache
+from itertools import accumulate
+from operator import sub, truediv
+from typing import List, Sequence
+
+BLOCKS = "▁▂▃▄▅▆▇█"
+
+
+def downsample(values: Sequence[float], width: int) -> List[float]:
+    """
+    Average the values into width buckets of (nearly) the same size, keeping their order.
+
+    Values which already fit the width (0 = no limit) are kept as they are. The sums of the
+    buckets are the differences of the prefix sums at their bounds, so every value is only
+    touched by accumulate() and the Python code runs once per bucket, not once per value.
+    """
+    count = len(values)
+    if not width or count <= width:
+        return list(values)
+    prefix = list(accumulate(values, initial=0))
+    bounds = [i * count // width for i in range(width + 1)]
+    edges = list(map(prefix.__getitem__, bounds))
+    sums = map(sub, edges[1:], edges)
+    sizes = map(sub, bounds[1:], bounds)
+    return list(map(truediv, sums, sizes))
+
+
+@lru_cache(maxsize=64)
+def sparkline(values: tuple, width: int = 0) -> str:
+    """
+    Draw the values as a line of block characters, downsampled to at most width columns (0 = one per value).
+
+    The blocks go from the lowest value, or 0 if there is no negative one, to the highest.
+    Memoized, so the same history is only drawn once, e.g. on every update of watch mode.
+    """
+    if not values:
+        return ""
+    points = downsample(values, width)
+    low = min(0, min(points))
+    high = max(points)
+    if high == low:
+        return BLOCKS[0] * len(points)
+    scale = (len(BLOCKS) - 1) / (high - low)
+    return "".join([BLOCKS[round((point - low) * scale)] for point in points])
@@ -1,4 +1,6 @@
-from .color import Color
+from functools import lru_cache
+from .ansi import DEFAULT, SGRState
+from .color import Color, ColorSystem
 
 STYLE_TO_CODE = {
     "bold": "1",
@@ -18,14 +20,23 @@ class Style:
     Definition of a complete style which may include text styling as well as foreground, background and underline color.
     """
 
-    def __init__(self, s: str):
+    def __init__(self, s: str, color_system: ColorSystem = ColorSystem.TRUECOLOR):
         self.style = s.strip("[ ]").lower()
+        self.color_system = color_system
 
     def get_ansi_style(self) -> str:
+        if self.color_system == ColorSystem.NONE:
+            return ""
         codes = self.parse_styles()
         fmt = ";".join(codes)
         return f"\x1b[0m\x1b[{fmt}m" if fmt else "\x1b[0m"
 
+    def get_state(self) -> SGRState:
+        """Get the SGR state the terminal is in after this style was applied."""
+        if self.color_system == ColorSystem.NONE:
+            return DEFAULT
+        return DEFAULT.apply(self.parse_styles())
+
     def parse_styles(self) -> tuple:
         """
         Parses the style string and returns a tuple of style codes in correct order.
@@ -38,13 +49,21 @@ class Style:
             if s in STYLE_TO_CODE:
                 codes.append(STYLE_TO_CODE[s])
             elif s.startswith(":"):  # background color
-                color = Color.parse(s[1:])
+                color = Color.parse(s[1:]).downgrade(self.color_system)
                 codes.extend(color.get_ansi_codes(foreground=False))
             elif s.startswith("_"):  # underline color
-                color = Color.parse(s[1:])
+                color = Color.parse(s[1:]).downgrade(self.color_system)
                 codes.extend(color.get_ansi_codes(foreground=False, underline=True))
             else:  # foreground color
-                color = Color.parse(s)
+                color = Color.parse(s).downgrade(self.color_system)
                 codes.extend(color.get_ansi_codes())
 
         return tuple(codes)
+
+
+@lru_cache(maxsize=1024)
+def get_sgr_state(
+    tag: str, color_system: ColorSystem = ColorSystem.TRUECOLOR
+) -> SGRState:
+    """Get the SGR state of a style tag such as "[bold grey50]". Results are memoized."""
+    return Style(tag, color_system).get_state()
@@ -0,0 +1,143 @@
+import re
+from typing import List, Mapping, Tuple
+from .ansi import DEFAULT, transition
+from .color import ColorSystem
+from .sparkline import sparkline
+from .style import get_sgr_state
+
+RE_TOKEN = re.compile(r"\\[\[{]|[\[{]")
+
+
+class TagParseError(Exception):
+    """Raised when a tag could not be parsed."""
+
+
+class Template:
+    """
+    A template compiled into literal runs and variable slots.
+
+    *Do not use this instance directly.*
+    Use Template.compile() or Console.compile() instead.
+    """
+
+    def __init__(self, parts: List[str], slots: Tuple[Tuple[int, str, str], ...]):
+        """Literal runs (with resolved ANSI sequences) and empty placeholders for the variables."""
+        self.parts = parts
+        """Triples of (index into parts, variable name, format spec)."""
+        self.slots = slots
+
+    @property
+    def variables(self) -> Tuple[str, ...]:
+        """Get the names of all the variables referenced by this template."""
+        return tuple(dict.fromkeys(name for _, name, _ in self.slots))
+
+    def to_dict(self) -> dict:
+        """Get the compiled template as JSON serializable data, which Template.from_dict() turns back into it."""
+        return {"parts": self.parts, "slots": self.slots}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Template":
+        """Recreate a template from the data of Template.to_dict(), without compiling it again."""
+        return cls(
+            list(data["parts"]),
+            tuple((i, name, spec) for i, name, spec in data["slots"]),
+        )
+
+    def render(self, variables: Mapping, width: int = 0) -> str:
+        """
+        Inject the given variables into the template and return the styled string.
+
+        Sparklines without a width of their own are as wide as the given width (0 = no limit).
+        """
+        parts = self.parts.copy()
+        for index, name, spec in self.slots:
+            val = variables.get(name)
+            if val is None:
+                raise TagParseError(f"No variable '{name}'.")
+
+            if spec:
+                parts[index] = format_value(name, val, spec, width)
+            else:
+                # Shorten floats to 1 decimal place
+                parts[index] = f"{val:.1f}" if isinstance(val, float) else str(val)
+
+        return "".join(parts)
+
+    @classmethod
+    def compile(
+        cls, s: str, color_system: ColorSystem = ColorSystem.TRUECOLOR
+    ) -> "Template":
+        """
+        Tokenize a string containing possible styles and variable injections into a Template.
+
+        Colors are downgraded to the given color system. With ColorSystem.NONE no escape sequences are emitted at all.
+        Style tags are only turned into the minimal escape sequence which changes the current style into theirs,
+        right before the next text, so repeated or overridden styles cost nothing.
+        """
+        parts = []
+        slots = []
+        literal = []
+        state = style = DEFAULT
+        ptr = 0
+        while True:
+            match = RE_TOKEN.search(s, ptr)
+            end = len(s) if match is None else match.start()
+            if end > ptr:
+                literal.append(transition(state, style))
+                literal.append(s[ptr:end])
+                state = style
+            if match is None:
+                break
+
+            start = match.start()
+            token = match.group()
+
+            if token[0] == "\\":  # Escaped bracket
+                literal.append(transition(state, style))
+                literal.append(token[1])
+                state = style
+                ptr = start + 2
+
+            elif token == "[":  # Beginning of a style
+                end = s.find("]", start + 1)
+                if end < 0:
+                    raise TagParseError("Matching ']' could not be found.")
+
+                style = get_sgr_state(s[start : end + 1], color_system)
+                ptr = end + 1
+
+            else:  # Beginning of a variable
+                end = s.find("}", start + 1)
+                if end < 0:
+                    raise TagParseError("Matching '}' could not be found.")
+
+                literal.append(transition(state, style))
+                state = style
+                parts.append("".join(literal))
+                literal = []
+                name, _, spec = s[start + 1 : end].partition(":")
+                slots.append((len(parts), name.strip(), spec.strip()))
+                parts.append("")
+                ptr = end + 1
+
+        literal.append(transition(state, DEFAULT))
+        parts.append("".join(literal))
+        return cls(parts, tuple(slots))
+
+
+def format_value(name: str, val, spec: str, width: int = 0) -> str:
+    """
+    Format the value of a variable as given by the format spec of its slot, e.g. `{queries.total:,}`.
+
+    `spark` draws a sequence of numbers as a sparkline of the given width and `sparkN` as one of N columns.
+    Any other spec is a Python format spec.
+    """
+    if spec.startswith("spark"):
+        columns = spec[len("spark") :]
+        if not isinstance(val, (list, tuple)) or columns and not columns.isdigit():
+            raise TagParseError(f"Can't draw variable '{name}' as '{spec}'.")
+        return sparkline(tuple(val), int(columns) if columns else width)
+    try:
+        return format(val, spec)
+    except (TypeError, ValueError) as e:
+        raise TagParseError(f"Invalid format '{spec}' of variable '{name}': {e}") from e
@@ -0,0 +1,99 @@
+import re
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+RE_UNSAFE = re.compile(r"[^\w.]")
+
+
+class Timings:
+    """
+    Durations of the phases of a run, such as connecting, authenticating, fetching each endpoint and rendering.
+
+    Phases are timed with a monotonic clock and may be timed from several threads at once.
+    They can be nested, e.g. connecting is part of the first request. A phase which runs
+    more than once, e.g. once per Pi-hole, adds up. The hook, if any,
+    is called with the name and the seconds of every phase as soon as it finishes.
+    """
+
+    def __init__(self, hook: Optional[Callable[[str, float], None]] = None):
+        self.hook = hook
+        """Pairs of (phase, seconds) in the order the phases finished."""
+        self.records = []
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time the code run in this context as the named phase."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name: str, seconds: float):
+        """Record a phase which took the given number of seconds."""
+        self.records.append((name, seconds))  # Atomic, so no lock is needed
+        if self.hook is not None:
+            self.hook(name, seconds)
+
+    def clear(self):
+        """Forget all the phases and start timing the run again."""
+        self.records = []
+        self.started = time.perf_counter()
+
+    def totals(self) -> dict:
+        """Get the milliseconds spent in each phase, in the order they first finished, and in total so far."""
+        totals = {}
+        for name, seconds in self.records:
+            totals[name] = totals.get(name, 0.0) + seconds * 1000
+        totals["total"] = (time.perf_counter() - self.started) * 1000
+        return totals
+
+    def variables(self) -> dict:
+        """Get the timings as template variables such as `_timing.fetch_ms`, rounded to 0.1 ms."""
+        return {
+            f"_timing.{RE_UNSAFE.sub('_', name)}_ms": round(ms, 1)
+            for name, ms in self.totals().items()
+        }
+
+    def report(self, fmt: str = "text") -> str:
+        """Get a report of the timings as an aligned table or, with fmt "json", as JSON."""
+        totals = self.totals()
+        if fmt == "json":
+            import json
+
+            return json.dumps({"phases_ms": totals})
+        width = max(map(len, totals))
+        return "\n".join(
+            f"{name:<{width}} {ms:>9.1f} ms" for name, ms in totals.items()
+        )
+
+
+class Deadline:
+    """
+    Budget of seconds shared by all the requests of a run, counted from when it's created.
+
+    Without a budget it never expires, so code which takes a Deadline doesn't need to check for one.
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.seconds = seconds
+        self.restart()
+
+    def restart(self):
+        """Start counting the budget again, e.g. for the next update in watch mode."""
+        self.expires = None if self.seconds is None else time.monotonic() + self.seconds
+
+    def remaining(self) -> Optional[float]:
+        """Get the seconds left, or None without a budget."""
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.monotonic())
+
+    def cap(self, timeout: Optional[float]) -> Optional[float]:
+        """Get the timeout of a single operation, shortened to the seconds left."""
+        remaining = self.remaining()
+        if remaining is None or timeout is None:
+            return timeout if remaining is None else remaining
+        return min(timeout, remaining)
@@ -0,0 +1,232 @@
+from collections.abc import Mapping
+from datetime import datetime, timezone
+from operator import itemgetter
+from typing import Iterator, List, Optional
+
+_MISSING = object()
+
+
+def flatten_dict(d, tld="") -> dict:
+    """Flatten the given dict recursively while prepending the upper level key to all the lower level keys separated by a dot (.)"""
+    new_dict = {}
+    for k, v in d.items():
+        if isinstance(v, dict):
+            lower = flatten_dict(v, tld=f"{tld}{k}.")
+            new_dict.update(lower)
+        else:
+            key = tld + k
+            new_dict[key] = v
+
+    return new_dict
+
+
+def time_ago(unix_timestamp: int, now: Optional[float] = None) -> dict:
+    now = (
+        datetime.now(timezone.utc)
+        if now is None
+        else datetime.fromtimestamp(now, timezone.utc)
+    )
+    past_time = datetime.fromtimestamp(unix_timestamp, timezone.utc)
+
+    delta = now - past_time
+
+    days = delta.days
+    hours, remainder = divmod(delta.seconds, 3600)
+    minutes, _ = divmod(remainder, 60)
+
+    return {
+        "gravity.relative.days": days,
+        "gravity.relative.hours": hours,
+        "gravity.relative.minutes": minutes,
+    }
+
+
+# The API endpoints and the first part of the names of the variables they provide
+ENDPOINTS = {
+    "info/version": ("version",),
+    "dns/blocking": ("blocking", "timer"),
+    "stats/summary": ("queries", "clients", "gravity"),
+    "stats/recent_blocked": ("recent_blocked",),
+    "stats/top_clients": ("client",),
+    "groups": ("group",),
+    "history": ("history",),
+}
+
+# The counts of queries which the history endpoint has for every interval
+HISTORY = ("total", "blocked", "cached", "forwarded")
+
+# The kinds of rows a template can be rendered for, with the API endpoint listing them
+# and the first part of the names of their variables
+ROWS = {
+    "clients": ("stats/top_clients", "client"),
+    "groups": ("groups", "group"),
+}
+
+# Endpoints whose data is only available as derived variables or as rows
+NOT_VARIABLES = {
+    "stats/recent_blocked",
+    "history",
+    *(query for query, _ in ROWS.values()),
+}
+
+# Variables derived from the samples of a counter, such as queries.total.rate_1m, by the last
+# part of their names, with the seconds their rate per minute is averaged over. None is the
+# change since the previous sample.
+DERIVED = {"rate_1m": 60, "rate_5m": 300, "delta": None}
+
+
+def get_endpoints(names: tuple) -> tuple:
+    """
+    Get the API endpoints which provide the given variables. Unknown variables require all of them.
+
+    Variables starting with an underscore, such as `_timing.total_ms`, are about the run itself and need none.
+    """
+    prefixes = {name.split(".", 1)[0] for name in names if not name.startswith("_")}
+    provided = {prefix for prefixes in ENDPOINTS.values() for prefix in prefixes}
+    if not prefixes <= provided:
+        return tuple(ENDPOINTS)
+    return tuple(
+        query
+        for query, query_prefixes in ENDPOINTS.items()
+        if prefixes.intersection(query_prefixes)
+    )
+
+
+def get_counters(names: tuple) -> tuple:
+    """Get the counters which the given derived variables, such as `queries.total.rate_1m`, are computed from."""
+    counters = {}
+    for name in names:
+        counter, _, suffix = name.rpartition(".")
+        if counter and suffix in DERIVED:
+            counters[counter] = None
+    return tuple(counters)
+
+
+class Variables(Mapping):
+    """
+    Read-only view of template variables over nested API responses.
+
+    Dotted variable names such as "version.core.local.version" are resolved against
+    the original nested data only when they are looked up, and memoized.
+    Sources are searched in order and may also be flat dicts with dotted keys.
+    """
+
+    def __init__(self, *sources: Mapping):
+        self.sources = sources
+        self._memo = {}
+
+    def __getitem__(self, name: str):
+        try:
+            return self._memo[name]
+        except KeyError:
+            pass
+
+        for source in self.sources:
+            val = _resolve(source, name)
+            if val is not _MISSING:
+                self._memo[name] = val
+                return val
+        raise KeyError(name)
+
+    def __iter__(self) -> Iterator[str]:
+        seen = set()
+        for source in self.sources:
+            for name in _iter_names(source):
+                if name not in seen:
+                    seen.add(name)
+                    yield name
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+def _resolve(source: Mapping, name: str):
+    """Look up a dotted name in nested mappings. Only leaf values count as variables."""
+    node = source.get(name, _MISSING)
+    if node is _MISSING:
+        node = source
+        parts = name.split(".")
+        for i, part in enumerate(parts):
+            if type(node) is not dict:
+                if isinstance(node, Variables):
+                    return node.get(".".join(parts[i:]), _MISSING)
+                if not isinstance(node, Mapping):
+                    return _MISSING
+            node = node.get(part, _MISSING)
+            if node is _MISSING:
+                return _MISSING
+
+    if type(node) is dict or isinstance(node, Mapping):
+        return _MISSING
+    return node
+
+
+def _iter_names(node: Mapping, prefix: str = "") -> Iterator[str]:
+    """Yield the dotted names of all the leaf values."""
+    if isinstance(node, Variables):
+        yield from (prefix + name for name in node)
+        return
+    for key, val in node.items():
+        if isinstance(val, Mapping):
+            yield from _iter_names(val, f"{prefix}{key}.")
+        else:
+            yield prefix + key
+
+
+def get_variables(responses: dict, now: Optional[float] = None) -> Variables:
+    """
+    Turn the API responses into template variables. Relative times are relative to now, if given.
+
+    The responses aren't copied, their values are only looked up when the template needs them.
+    """
+    derived = {}
+    blocked = responses.get("stats/recent_blocked", {}).get("blocked")
+    if blocked is not None:
+        derived["recent_blocked"] = blocked[0] if blocked else ""
+
+    gravity = responses.get("stats/summary", {}).get("gravity", {})
+    if "last_update" in gravity:
+        derived.update(time_ago(gravity["last_update"], now))
+
+    # Tuples, so sparklines of the same history are drawn only once
+    history = responses.get("history", {}).get("history")
+    if isinstance(history, list):
+        for key in HISTORY:
+            try:
+                derived[f"history.{key}"] = tuple(map(itemgetter(key), history))
+            except (KeyError, TypeError):
+                pass  # Not a count this version of the API has
+
+    return Variables(
+        derived,
+        *(
+            data
+            for query, data in responses.items()
+            if query not in NOT_VARIABLES and isinstance(data, dict)
+        ),
+    )
+
+
+def get_rows(responses: dict, kind: str) -> List[dict]:
+    """
+    Get the variables of every client or group listed in the API responses, in the order they're listed.
+
+    Clients are the top clients, with client.name, client.ip, client.count, client.rank and
+    client.percent of all the queries. Groups have group.name, group.comment, group.enabled, group.id etc.
+    """
+    query, prefix = ROWS[kind]
+    data = responses.get(query)
+    if not isinstance(data, dict):
+        return []
+
+    rows = []
+    if kind == "clients":
+        total = data.get("total_queries")
+        for rank, client in enumerate(data.get("clients", []), 1):
+            row = {prefix: client, f"{prefix}.rank": rank}
+            if total:
+                row[f"{prefix}.percent"] = client.get("count", 0) / total * 100
+            rows.append(row)
+    else:
+        rows.extend({prefix: group} for group in data.get("groups", []))
+    return rows